@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Promptchad - Pipeline benchmarks
+
+Measures promptchad's own overhead (client handling, retries/limits/cache
+plumbing, result shaping, JSON serialization, log writing) by running the
+request pipeline against providers that answer instantly:
+
+- `inprocess`: provider functions replaced by coroutines returning canned
+  results, so only promptchad's code is measured
+- `mock`: real SDK clients talking HTTP to a zero-latency mock_provider.py
+
+Each scenario/concurrency pair runs in its own subprocess so peak RSS is
+measured per run. Results are written as JSON and can be compared against
+an earlier run with --compare.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SCENARIOS = ["run_test", "batch", "flask"]
+PROVIDER_NAMES = ["openai", "anthropic", "google"]
+
+
+def fake_result(provider: str) -> dict:
+    """A successful result shaped like the real provider's."""
+    usage = {
+        "openai": {"prompt_tokens": 12, "completion_tokens": 50, "total_tokens": 62},
+        "anthropic": {"input_tokens": 12, "output_tokens": 50},
+        "google": {"prompt_token_count": 12, "candidates_token_count": 50, "total_token_count": 62},
+    }[provider]
+    return {
+        "success": True,
+        "response": "the quick brown fox jumps over the lazy dog " * 6,
+        "model": f"bench-{provider}",
+        "usage": usage,
+        "elapsed_seconds": 0.0,
+    }
+
+
+def install_fake_providers():
+    """Replace the provider functions with instant in-process fakes."""
+    import promptchad
+
+    def make(provider):
+        result = fake_result(provider)
+
+        async def call(prompt: str, config: dict) -> dict:
+            # Yield like a real provider call does, so concurrent callers interleave
+            await asyncio.sleep(0)
+            return dict(result)
+
+        return call
+
+    for provider in PROVIDER_NAMES:
+        promptchad.PROVIDERS[provider] = make(provider)
+
+
+def bench_config(mode: str) -> tuple[dict, Callable[[], None]]:
+    """Build a config for the provider mode. Returns (config, cleanup)."""
+    if mode == "inprocess":
+        install_fake_providers()
+        providers = {name: {"api_key": "bench"} for name in PROVIDER_NAMES}
+        return {"providers": providers}, lambda: None
+
+    from mock_provider import MockSettings, serve_in_thread
+
+    url, stop = serve_in_thread(MockSettings())
+    providers = {
+        "openai": {"api_key": "bench", "base_url": f"{url}/v1"},
+        "anthropic": {"api_key": "bench", "base_url": url},
+        "google": {"api_key": "bench", "base_url": f"{url}/v1beta"},
+    }
+    return {"providers": providers}, stop
+
+
+async def monitor_loop_lag(samples: list, interval: float = 0.001):
+    """Record how late the event loop wakes up from short sleeps."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def with_lag_monitor(coro, samples: list):
+    monitor = asyncio.create_task(monitor_loop_lag(samples))
+    try:
+        return await coro
+    finally:
+        monitor.cancel()
+
+
+async def warm_up(config: dict):
+    """One untimed run, so SDK imports and client setup aren't measured."""
+    import promptchad
+
+    await promptchad.run_test("Warm-up prompt", config)
+
+
+def start_timer() -> Callable[[], tuple[float, float]]:
+    """Start timing; the returned function gives (elapsed, cpu) seconds so far."""
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    return lambda: (time.perf_counter() - start, time.process_time() - cpu_start)
+
+
+async def measure_async(scenario: Callable, config: dict, concurrency: int, calls: int, lag: list) -> tuple:
+    """Warm up, then time an async scenario. Returns (failures, elapsed, cpu)."""
+    await warm_up(config)
+    stop = start_timer()
+    failures = await with_lag_monitor(scenario(config, concurrency, calls), lag)
+    return failures, *stop()
+
+
+async def scenario_run_test(config: dict, concurrency: int, calls: int) -> int:
+    """Workers calling run_test() back to back. Returns the failure count."""
+    import promptchad
+
+    runs = max(1, calls // len(PROVIDER_NAMES))
+    remaining = iter(range(runs))
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        for i in remaining:
+            results = await promptchad.run_test(f"Benchmark prompt {i}", config)
+            failures += sum(not r.get("success") for r in results.values())
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return failures
+
+
+async def scenario_batch(config: dict, concurrency: int, calls: int) -> int:
+    """The batch path: dataset file -> expand_batch -> run_batch -> JSONL."""
+    import promptchad
+
+    rows = max(1, calls // len(PROVIDER_NAMES))
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = Path(tmp) / "dataset.jsonl"
+        with open(dataset, "w") as f:
+            for i in range(rows):
+                f.write(json.dumps({"input": f"Customer query number {i}"}) + "\n")
+
+        jobs = promptchad.expand_batch(
+            {"bench": "You are a helpful support agent."},
+            promptchad.read_dataset(dataset),
+            config,
+        )
+        with open(os.devnull, "w") as out:
+            summary = await promptchad.run_batch(jobs, out, concurrency)
+    return summary["failed"]
+
+
+def scenario_flask(config: dict, concurrency: int, calls: int, lag: list) -> tuple:
+    """Concurrent POSTs to /api/run through Flask's test client.
+
+    Lag is measured on the web UI's shared event loop. Returns (failures,
+    elapsed, cpu) like `measure_async`.
+    """
+    import toml
+
+    import web_ui
+
+    with tempfile.TemporaryDirectory() as tmp:
+        web_ui.CONFIG_PATH = Path(tmp) / "config.toml"
+        web_ui.LOGS_DIR = Path(tmp) / "logs"
+        web_ui.CONFIG_PATH.write_text(toml.dumps(config))
+
+        requests = max(1, calls // (2 * len(PROVIDER_NAMES)))
+        remaining = iter(range(requests))
+        lock = threading.Lock()
+        failures = 0
+
+        def worker():
+            nonlocal failures
+            client = web_ui.app.test_client()
+            while True:
+                with lock:
+                    i = next(remaining, None)
+                if i is None:
+                    return
+                data = client.post(
+                    "/api/run",
+                    json={"prompt_a": f"Prompt A {i}", "prompt_b": f"Prompt B {i}", "shared_input": "Query"},
+                ).get_json()
+                results = [*data["results_a"].values(), *data["results_b"].values()]
+                with lock:
+                    failures += sum(not r.get("success") for r in results)
+
+        web_ui.event_loop.run(warm_up(config))
+        stop = start_timer()
+        monitor = asyncio.run_coroutine_threadsafe(monitor_loop_lag(lag), web_ui.event_loop.loop)
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for future in [pool.submit(worker) for _ in range(concurrency)]:
+                    future.result()
+            elapsed, cpu = stop()
+        finally:
+            monitor.cancel()
+        if web_ui.log_writer:
+            web_ui.log_writer.close()
+    return failures, elapsed, cpu
+
+
+def calls_made(scenario: str, calls: int) -> int:
+    """Provider calls a scenario actually makes for a requested call count."""
+    n = len(PROVIDER_NAMES)
+    if scenario == "flask":
+        return max(1, calls // (2 * n)) * 2 * n
+    return max(1, calls // n) * n
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run_single(scenario: str, mode: str, concurrency: int, calls: int) -> dict:
+    """Run one scenario at one concurrency level in this process."""
+    import promptchad
+
+    config, cleanup = bench_config(mode)
+    lag = []
+    try:
+        if scenario == "flask":
+            failures, elapsed, cpu = scenario_flask(config, concurrency, calls, lag)
+        else:
+            fn = scenario_run_test if scenario == "run_test" else scenario_batch
+            failures, elapsed, cpu = promptchad.run_async(measure_async(fn, config, concurrency, calls, lag))
+    finally:
+        cleanup()
+
+    total = calls_made(scenario, calls)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "calls": total,
+        "failures": failures,
+        "elapsed_seconds": round(elapsed, 4),
+        "calls_per_second": round(total / elapsed, 1),
+        "wall_us_per_call": round(elapsed / total * 1e6, 1),
+        "cpu_us_per_call": round(cpu / total * 1e6, 1),
+        "loop_lag_ms": {
+            "p50": round(percentile(lag, 0.5) * 1000, 3),
+            "p99": round(percentile(lag, 0.99) * 1000, 3),
+            "max": round(max(lag) * 1000, 3),
+        } if lag else None,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1
+        ),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict):
+    """Print throughput and overhead changes against a baseline run."""
+    old = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    if baseline["meta"].get("provider") != current["meta"]["provider"]:
+        print(f"\nNote: baseline used --provider {baseline['meta'].get('provider')}, not {current['meta']['provider']}")
+    print(f"\nCompared to {baseline['meta'].get('git_revision')} ({baseline['meta']['timestamp']}):")
+    for r in current["results"]:
+        before = old.get((r["scenario"], r["concurrency"]))
+        if not before:
+            continue
+        speedup = r["calls_per_second"] / before["calls_per_second"]
+        overhead = r["cpu_us_per_call"] - before["cpu_us_per_call"]
+        print(
+            f"  {r['scenario']:<9} c={r['concurrency']:<5} "
+            f"{speedup:6.2f}x calls/s   {overhead:+9.1f} us CPU/call"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark promptchad's request pipeline")
+    parser.add_argument(
+        "--scenario",
+        choices=SCENARIOS,
+        action="append",
+        help="Scenario to run; repeat for several (default: all)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        action="append",
+        help="Concurrency level; repeat for several (default: 1, 10, 100, 1000)",
+    )
+    parser.add_argument(
+        "--provider",
+        choices=["inprocess", "mock"],
+        default="inprocess",
+        help="Instant in-process fakes or the HTTP mock server (default: inprocess)",
+    )
+    parser.add_argument("--calls", type=int, default=3000, help="Provider calls per run (default: 3000)")
+    parser.add_argument("--out", type=Path, help="Where to save results (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    scenarios = args.scenario or SCENARIOS
+    levels = args.concurrency or [1, 10, 100, 1000]
+
+    if args.single:
+        print(json.dumps(run_single(scenarios[0], args.provider, levels[0], args.calls)))
+        return
+
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            proc = subprocess.run(
+                [
+                    sys.executable, __file__, "--single",
+                    "--scenario", scenario,
+                    "--concurrency", str(concurrency),
+                    "--provider", args.provider,
+                    "--calls", str(args.calls),
+                ],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                print(f"{scenario} c={concurrency} failed:\n{proc.stderr}", file=sys.stderr)
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            lag = result["loop_lag_ms"]
+            print(
+                f"{scenario:<9} c={concurrency:<5} {result['calls_per_second']:>10.1f} calls/s  "
+                f"{result['cpu_us_per_call']:>8.1f} us CPU/call  "
+                f"lag p99 {lag['p99'] if lag else '-':>7} ms  "
+                f"RSS {result['peak_rss_mb']:>6.1f} MB  "
+                f"failures {result['failures']}"
+            )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "provider": args.provider,
+            "calls": args.calls,
+        },
+        "results": results,
+    }
+
+    out = args.out or ROOT / "benchmarks" / "results" / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved results to {out}")
+
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
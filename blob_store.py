@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Promptchad - Blob store
+
+Content-addressed storage for the deduplicated log format. Prompt texts,
+shared inputs and config snapshots are stored once, under the hash of their
+content, and log entries refer to them as `{"$blob": "<sha256>"}`.
+`unpack_entry` turns such an entry back into the full format.
+
+Run as a script to print log segments with their blobs filled back in:
+
+    python blob_store.py logs/2025-01-15.jsonl.gz | jq .
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+BLOB_KEY = "$blob"
+
+# Texts shorter than this stay inline; a reference would be about as long
+MIN_BLOB_CHARS = 80
+
+
+def blob_hash(value) -> str:
+    """Hash of a JSON value's canonical encoding."""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class BlobStore:
+    """Directory of JSON values, one file per value, named by content hash."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._known = set()
+        self._lock = threading.Lock()
+        self.get = lru_cache(maxsize=1024)(self._read)
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.json"
+
+    def put(self, value) -> str:
+        """Store a value if it isn't stored yet. Returns its hash."""
+        digest = blob_hash(value)
+        with self._lock:
+            if digest in self._known:
+                return digest
+            path = self._path(digest)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(value, f)
+                    os.replace(tmp, path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+            self._known.add(digest)
+        return digest
+
+    def ref(self, value) -> dict:
+        """Store a value and return the reference to put in its place."""
+        return {BLOB_KEY: self.put(value)}
+
+    def _read(self, digest: str):
+        with open(self._path(digest), encoding="utf-8") as f:
+            return json.load(f)
+
+
+def pack_entry(entry: dict, blobs: BlobStore) -> dict:
+    """Move an entry's input texts and config into the blob store."""
+    def pack(value):
+        if isinstance(value, str):
+            return blobs.ref(value) if len(value) >= MIN_BLOB_CHARS else value
+        if isinstance(value, dict):
+            return {key: pack(v) for key, v in value.items()}
+        return value
+
+    return {**entry, "inputs": pack(entry.get("inputs", {})), "config": blobs.ref(entry.get("config", {}))}
+
+
+def unpack_entry(entry, blobs: BlobStore):
+    """Replace blob references with their values. Full-format entries pass through unchanged."""
+    if isinstance(entry, dict):
+        if len(entry) == 1 and BLOB_KEY in entry:
+            return blobs.get(entry[BLOB_KEY])
+        return {key: unpack_entry(value, blobs) for key, value in entry.items()}
+    if isinstance(entry, list):
+        return [unpack_entry(value, blobs) for value in entry]
+    return entry
+
+
+def main():
+    from log_writer import list_segments, open_segment
+
+    parser = argparse.ArgumentParser(description="Print run log entries in the full format")
+    parser.add_argument("segments", nargs="*", type=Path, help="Log segments (default: all in --logs)")
+    parser.add_argument("--logs", type=Path, default=Path("logs"), help="Log directory (default: logs)")
+    args = parser.parse_args()
+
+    blobs = BlobStore(args.logs / "blobs")
+    try:
+        for segment in args.segments or list_segments(args.logs):
+            with open_segment(segment) as f:
+                for line in f:
+                    print(json.dumps(unpack_entry(json.loads(line), blobs)))
+    except BrokenPipeError:
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
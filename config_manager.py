@@ -0,0 +1,284 @@
+"""
+Promptchad - Config manager
+
+Parses config.toml once, validates it, and hands out immutable snapshots.
+The file is only parsed again when it changes on disk (mtime, size or
+inode) or is saved through the manager, so concurrent requests share one
+parsed config instead of each re-reading the file. Saves replace the file
+atomically, and a file that fails to parse leaves the last good snapshot in
+use.
+"""
+
+import os
+import sys
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+
+from atomic_files import atomic_write_text
+from tracing import EXPORTERS
+
+NUMBER = (int, float)
+
+# Expected types of provider settings; other keys are passed through as is
+PROVIDER_FIELDS = {
+    "enabled": bool,
+    "api_key": str,
+    "model": str,
+    "base_url": str,
+    "client": str,
+    "temperature": NUMBER,
+    "max_tokens": int,
+    "requests_per_minute": NUMBER,
+    "tokens_per_minute": NUMBER,
+    "max_retries": int,
+    "retry_deadline": NUMBER,
+    "hedge": bool,
+    "hedge_max_rate": NUMBER,
+    "max_connections": int,
+    "max_keepalive_connections": int,
+}
+
+# How a provider is called: through its SDK, or over plain HTTP
+CLIENTS = ("sdk", "http")
+
+# Top-level sections that must be tables when present
+SECTIONS = ("providers", "cache", "jobs", "logs", "tracing", "debug")
+
+# Redacted secrets start with this; saving one back keeps the stored value
+REDACTED_PREFIX = "****"
+
+
+class ConfigError(ValueError):
+    """The config file can't be parsed or has invalid settings."""
+
+
+def _check_provider(name: str, settings):
+    """Validate a `[providers.<name>]` table."""
+    if not isinstance(settings, Mapping):
+        raise ConfigError(f"providers.{name} must be a table")
+    for key, expected in PROVIDER_FIELDS.items():
+        value = settings.get(key)
+        if value is None:
+            continue
+        # bool is an int subclass, but `max_tokens = true` is a mistake
+        if not isinstance(value, expected) or (expected is not bool and isinstance(value, bool)):
+            raise ConfigError(f"providers.{name}.{key} has the wrong type: {value!r}")
+        if expected is not bool and expected is not str and value < 0:
+            raise ConfigError(f"providers.{name}.{key} must not be negative")
+    if settings.get("client", "sdk") not in CLIENTS:
+        raise ConfigError(f"providers.{name}.client must be one of {', '.join(CLIENTS)}")
+    temperature = settings.get("temperature")
+    if temperature is not None and temperature > 2:
+        raise ConfigError(f"providers.{name}.temperature must be between 0 and 2")
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """One parsed version of the config file.
+
+    `data` is the config as read-only mappings (tuples for arrays), usable
+    wherever a config dict is read.
+    """
+
+    data: Mapping
+    exists: bool = True
+    # (mtime_ns, size, inode) of the file this was parsed from
+    stamp: tuple | None = field(default=None, compare=False)
+
+    @classmethod
+    def from_dict(cls, config: dict, exists: bool = True, stamp: tuple | None = None) -> "ConfigSnapshot":
+        """Validate a config and freeze it into a snapshot."""
+        for section in SECTIONS:
+            if not isinstance(config.get(section, {}), Mapping):
+                raise ConfigError(f"[{section}] must be a table")
+        exporter = config.get("tracing", {}).get("exporter", "none")
+        if exporter not in EXPORTERS:
+            raise ConfigError(f"tracing.exporter must be one of {', '.join(EXPORTERS)}, not {exporter!r}")
+        if "logs" in config:
+            _check_logs(config["logs"])
+        for name, settings in config.get("providers", {}).items():
+            _check_provider(name, settings)
+        return cls(freeze(config), exists, stamp)
+
+    def to_dict(self) -> dict:
+        """A plain, mutable copy of the config."""
+        return thaw(self.data)
+
+
+def _check_logs(logs: Mapping):
+    """Validate the `[logs]` section, so a bad setting is reported on load
+    rather than when the first run is logged."""
+    from log_writer import check_settings
+
+    try:
+        check_settings(logs.get("max_size_mb", 100), logs.get("compress", "gzip"), logs.get("format", "full"))
+    except ValueError as e:
+        raise ConfigError(f"[logs]: {e}") from e
+
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(v) for key, v in value.items()})
+    if isinstance(value, list | tuple):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Undo `freeze`."""
+    if isinstance(value, Mapping):
+        return {key: thaw(v) for key, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def redact_secret(value: str) -> str:
+    """Redact a secret, showing only its last 4 characters."""
+    if not value or len(value) <= 4:
+        return REDACTED_PREFIX
+    return f"{REDACTED_PREFIX}{value[-4:]}"
+
+
+def _secret_paths(config: Mapping) -> list[tuple[str, ...]]:
+    """Key paths of the secrets in a config: API keys and the profile token."""
+    paths = [
+        ("providers", name, "api_key")
+        for name, settings in config.get("providers", {}).items()
+        if isinstance(settings, Mapping)
+    ]
+    if isinstance(config.get("debug"), Mapping):
+        paths.append(("debug", "profile_token"))
+    return paths
+
+
+def _lookup(config: Mapping, path: tuple[str, ...]):
+    for key in path:
+        if not isinstance(config, Mapping):
+            return None
+        config = config.get(key)
+    return config
+
+
+def redact_secrets(config: Mapping) -> dict:
+    """A plain copy of a config with its secrets redacted, safe to hand to clients."""
+    config = thaw(config)
+    for *tables, key in _secret_paths(config):
+        table = _lookup(config, tables)
+        if table.get(key):
+            table[key] = redact_secret(table[key])
+    return config
+
+
+def _restore_secrets(config: dict, current: Mapping) -> dict:
+    """Copy of `config` with redacted secrets replaced by their `current` values."""
+    config = thaw(config)
+    for *tables, key in _secret_paths(config):
+        table = _lookup(config, tables)
+        value = table.get(key)
+        if isinstance(value, str) and value.startswith(REDACTED_PREFIX):
+            stored = _lookup(current, (*tables, key))
+            if stored:
+                table[key] = stored
+            else:
+                del table[key]
+    return config
+
+
+class ConfigManager:
+    """Cached access to one config file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._snapshot: ConfigSnapshot | None = None
+        # Stamp of a file version that failed to load, so it isn't retried
+        self._bad_stamp: tuple | None = None
+        self._lock = threading.Lock()
+
+    def _stamp(self) -> tuple | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def snapshot(self) -> ConfigSnapshot:
+        """The current config, re-parsed only if the file has changed.
+
+        A missing file gives an empty snapshot with `exists` False. If the
+        file can't be parsed or is invalid, the last good snapshot is kept;
+        ConfigError is raised only when there is none.
+        """
+        stamp = self._stamp()
+        snapshot = self._snapshot
+        if self._is_current(snapshot, stamp):
+            return snapshot
+
+        with self._lock:
+            if self._is_current(self._snapshot, stamp):
+                return self._snapshot
+            try:
+                self._snapshot = self._load(stamp)
+            except ConfigError as e:
+                if self._snapshot is None:
+                    raise
+                self._bad_stamp = stamp
+                print(f"Warning: {e}; keeping the last good config", file=sys.stderr)
+            return self._snapshot
+
+    def _is_current(self, snapshot: ConfigSnapshot | None, stamp: tuple | None) -> bool:
+        """Whether `snapshot` is still the right answer for the file at `stamp`."""
+        if snapshot is None:
+            return False
+        if stamp is None:
+            # The file is missing: only an empty snapshot is current
+            return not snapshot.exists
+        return stamp == snapshot.stamp or (self._bad_stamp is not None and stamp == self._bad_stamp)
+
+    def _load(self, stamp: tuple | None) -> ConfigSnapshot:
+        if stamp is None:
+            return ConfigSnapshot.from_dict({}, exists=False)
+        import toml  # Not needed by CLI runs forwarded to a daemon
+
+        try:
+            config = toml.load(self.path)
+        except (OSError, toml.TomlDecodeError) as e:
+            raise ConfigError(f"Could not read {self.path}: {e}") from e
+        return ConfigSnapshot.from_dict(config, stamp=stamp)
+
+    def save(self, config: dict) -> ConfigSnapshot:
+        """Validate and atomically write a new config, making it the current snapshot.
+
+        Secrets sent back in their redacted form (see `redact_secrets`) keep
+        the value already stored.
+        """
+        import toml
+
+        try:
+            current = self.snapshot().data
+        except ConfigError:
+            current = {}
+        config = _restore_secrets(config, current)
+        ConfigSnapshot.from_dict(config)
+        with self._lock:
+            atomic_write_text(self.path, toml.dumps(config))
+            self._snapshot = self._load(self._stamp())
+            self._bad_stamp = None
+            return self._snapshot
+
+
+_managers: dict[Path, ConfigManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_config_manager(path: Path) -> ConfigManager:
+    """Return the shared manager for a config file."""
+    key = Path(path).resolve()
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = ConfigManager(Path(path))
+        return _managers[key]
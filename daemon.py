@@ -0,0 +1,204 @@
+"""
+Promptchad - Daemon
+
+`promptchad serve` keeps one process running with warm provider clients
+and connection pools, open response caches and shared rate limiters, and
+runs prompts for the CLI over a Unix domain socket. The CLI forwards its
+run to the daemon when one is listening and otherwise runs in-process.
+
+Each connection carries one run: the CLI sends a JSON request line, and the
+daemon answers with JSON lines ending in a "done" or "error" message.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+
+PROTOCOL_VERSION = 1
+
+
+class DaemonUnavailable(Exception):
+    """No daemon is listening, or it can't serve this run."""
+
+
+def default_socket_path() -> Path:
+    """$PROMPTCHAD_SOCKET, else promptchad.sock in the user's runtime directory
+    (or a private promptchad-<uid> directory under the temp directory)."""
+    if os.environ.get("PROMPTCHAD_SOCKET"):
+        return Path(os.environ["PROMPTCHAD_SOCKET"])
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(os.environ["XDG_RUNTIME_DIR"]) / "promptchad.sock"
+    user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    return Path(tempfile.gettempdir()) / f"promptchad-{user}" / "promptchad.sock"
+
+
+def _check_owner(path: Path):
+    """Raise DaemonUnavailable unless `path` is a socket owned by this user.
+
+    Anyone can create files in a shared temp directory; a socket put there
+    by another user would receive our prompts and could answer with its own
+    results.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError as e:
+        raise DaemonUnavailable(str(e)) from e
+    if not stat.S_ISSOCK(st.st_mode):
+        raise DaemonUnavailable(f"{path} is not a socket")
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise DaemonUnavailable(f"{path} belongs to another user")
+
+
+def forward(socket_path: Path, request: dict) -> Iterator[dict]:
+    """Send a run to the daemon and yield its messages.
+
+    Raises DaemonUnavailable before anything is yielded if the daemon isn't
+    running or turns the run down, so the caller can run it in-process.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("Unix sockets are not supported here")
+    _check_owner(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except OSError as e:
+        sock.close()
+        raise DaemonUnavailable(str(e)) from e
+
+    with sock, sock.makefile("rb") as responses:
+        sock.sendall(json.dumps({"version": PROTOCOL_VERSION, "cwd": os.getcwd(), **request}).encode() + b"\n")
+        first = responses.readline()
+        if not first:
+            raise DaemonUnavailable("The daemon closed the connection")
+        message = json.loads(first)
+        if message["type"] == "unavailable":
+            raise DaemonUnavailable(message["reason"])
+        yield message
+        for line in responses:
+            yield json.loads(line)
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Run one forwarded request and stream back its output."""
+    import tracing
+    from config_manager import ConfigError, get_config_manager
+    from promptchad import open_cache, run_test, stream_test
+
+    try:
+        line = await reader.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        # Relative paths in the config (such as the cache) must mean the same thing
+        if request.get("version") != PROTOCOL_VERSION or request.get("cwd") != os.getcwd():
+            await _send(writer, {"type": "unavailable", "reason": "different protocol version or directory"})
+            return
+
+        try:
+            snapshot = get_config_manager(Path(request["config"])).snapshot()
+        except ConfigError as e:
+            await _send(writer, {"type": "error", "error": str(e)})
+            return
+        if not snapshot.exists:
+            await _send(writer, {"type": "error", "error": f"Config file not found: {request['config']}"})
+            return
+        config = snapshot.data
+        tracing.configure(config.get("tracing", {}))
+        cache = open_cache(config, request.get("cache", "off"))
+
+        if request.get("stream"):
+            async for provider, event in stream_test(request["prompt"], config, cache):
+                await _send(writer, {"provider": provider, **event})
+        else:
+            results = await run_test(request["prompt"], config, cache)
+            await _send(writer, {"type": "results", "results": results})
+        await _send(writer, {"type": "done"})
+    except ConnectionError:
+        pass  # The CLI went away mid-run
+    except Exception as e:
+        try:
+            await _send(writer, {"type": "error", "error": f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+    finally:
+        writer.close()
+
+
+def _in_use(socket_path: Path) -> bool:
+    """Whether a daemon is already listening on the socket."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+async def serve(socket_path: Path):
+    """Serve forwarded runs until interrupted."""
+    from promptchad import close_clients
+
+    # A directory created here is private; existing ones keep their permissions
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if hasattr(os, "getuid") and socket_path.parent.stat().st_uid not in (os.getuid(), 0):
+        raise RuntimeError(f"{socket_path.parent} belongs to another user")
+    if socket_path.exists():
+        if _in_use(socket_path):
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+        socket_path.unlink()  # Left behind by a daemon that didn't exit cleanly
+
+    # Only this user may connect: runs use their API keys
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle_connection, path=str(socket_path))
+    finally:
+        os.umask(umask)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f"Serving on {socket_path}", file=sys.stderr)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        socket_path.unlink(missing_ok=True)
+        await close_clients()
+
+
+def serve_main(argv: list[str]):
+    """Entry point for `promptchad serve`."""
+    parser = argparse.ArgumentParser(
+        prog="promptchad serve",
+        description="Keep a warm promptchad process running for the CLI to forward runs to",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Unix socket to listen on (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.socket))
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -44,6 +44,10 @@
     test-prompt.exec = ''
       uv run python promptchad.py prompts/sample.txt "$@"
     '';
+
+    mock.exec = ''
+      uv run python mock_provider.py "$@"
+    '';
   };
 
   # Pre-commit hooks (optional)
@@ -59,6 +63,7 @@
     echo "  dev          - Start the web UI server"
     echo "  cli <file>   - Run CLI with a prompt file"
     echo "  test-prompt  - Test with the sample prompt"
+    echo "  mock         - Start the mock provider server"
     echo ""
     echo "First time? Add your API keys to config.toml"
     echo ""
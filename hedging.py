@@ -0,0 +1,99 @@
+"""
+Promptchad - Hedged requests
+
+Duplicate slow provider calls and keep whichever answer arrives first.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+
+class Hedger:
+    """Latency tracking and hedging for one provider model.
+
+    Every call's latency is recorded. Once enough samples are in, a call
+    that runs past the `quantile` latency gets a duplicate request, as long
+    as no more than `max_rate` of calls have been hedged so far.
+    """
+
+    def __init__(self, max_rate: float = 0.1, quantile: float = 0.9, window: int = 200, min_samples: int = 20):
+        self.max_rate = max_rate
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Record the latency of a completed call."""
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def hedge_delay(self) -> float | None:
+        """Observed latency quantile, or None until there are enough samples."""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+    def _take_hedge(self, has_capacity: Callable[[], bool] | None) -> bool:
+        """Use up one hedge if that keeps the hedge rate under `max_rate` and
+        `has_capacity` (if given) allows another request."""
+        with self._lock:
+            if self.hedges + 1 > self.max_rate * self.calls:
+                return False
+            if has_capacity is not None and not has_capacity():
+                return False
+            self.hedges += 1
+            return True
+
+    async def call(
+        self,
+        make_call: Callable[[], Awaitable[dict]],
+        hedge: bool = True,
+        has_capacity: Callable[[], bool] | None = None,
+    ) -> dict:
+        """Run a call, hedging it if it is slow and `hedge` is set.
+
+        `has_capacity` is asked just before a hedge is sent and takes the
+        capacity for it (e.g. from a rate limiter); if it returns False the
+        hedge is skipped rather than waited for.
+
+        Hedged results are marked with `"hedged": True`. When one request
+        succeeds the other is cancelled; if the first to finish failed, the
+        other one is still awaited.
+        """
+        async def timed():
+            start = time.monotonic()
+            result = await make_call()
+            if result.get("success"):
+                self.record(time.monotonic() - start)
+            return result
+
+        with self._lock:
+            self.calls += 1
+
+        delay = self.hedge_delay() if hedge else None
+        if delay is None:
+            return await timed()
+
+        pending = {asyncio.ensure_future(timed())}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done or not self._take_hedge(has_capacity):
+                return await (done or pending).pop()
+
+            pending.add(asyncio.ensure_future(timed()))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                result = done.pop().result()
+                if result.get("success") or not pending:
+                    return {**result, "hedged": True}
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,190 @@
+"""
+Promptchad - Job queue
+
+Background runs for the web UI: jobs are persisted in SQLite, executed by a
+bounded pool on the shared event loop, and can be polled and cancelled.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+# Job states. Queued and running jobs are picked up again after a restart.
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+UNFINISHED = (QUEUED, RUNNING)
+
+
+class JobStore:
+    """SQLite table of jobs: their request, state and (partial) results."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                request TEXT NOT NULL,
+                results TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+
+    def create(self, request: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, request, results, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(request), "{}", now, now),
+            )
+        return job_id
+
+    def update(
+        self,
+        job_id: str,
+        status: str | None = None,
+        results: dict | None = None,
+        error: str | None = None,
+        only_if: tuple[str, ...] | None = None,
+    ) -> bool:
+        """Update a job, atomically checking it is in one of the `only_if`
+        states (if given). Returns whether the job was updated."""
+        fields = {"updated_at": time.time()}
+        if status is not None:
+            fields["status"] = status
+        if results is not None:
+            fields["results"] = json.dumps(results)
+        if error is not None:
+            fields["error"] = error
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        query, params = f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id]
+        if only_if:
+            query += f" AND status IN ({', '.join('?' * len(only_if))})"
+            params.extend(only_if)
+        with self._lock:
+            return self._db.execute(query, params).rowcount == 1
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def unfinished(self) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at", UNFINISHED
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "request": json.loads(row["request"]),
+            "results": json.loads(row["results"]),
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+
+class JobQueue:
+    """Runs stored jobs on an event loop, at most `concurrency` at a time.
+
+    `execute(request, report)` does the work for a job. It calls
+    `report(results)` whenever it has new partial results and returns the
+    final results.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        loop: asyncio.AbstractEventLoop,
+        execute: Callable[[dict, Callable[[dict], None]], Awaitable[dict]],
+        concurrency: int = 4,
+    ):
+        self.store = store
+        self.loop = loop
+        self.execute = execute
+        self.concurrency = concurrency
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._slots = None
+
+    def submit(self, request: dict) -> str:
+        """Store a new job and schedule it. Safe to call from any thread."""
+        job_id = self.store.create(request)
+        self.loop.call_soon_threadsafe(self._start, job_id, request)
+        return job_id
+
+    def resume(self):
+        """Reschedule jobs left queued or running by a previous process."""
+        for job in self.store.unfinished():
+            if not self.store.update(job["id"], status=QUEUED, only_if=UNFINISHED):
+                continue
+            self.loop.call_soon_threadsafe(self._start, job["id"], job["request"])
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it already finished."""
+        if not self.store.update(job_id, status=CANCELLED, only_if=UNFINISHED):
+            return False
+        self.loop.call_soon_threadsafe(self._cancel_task, job_id)
+        return True
+
+    def pending(self) -> int:
+        """Number of jobs queued or running in this process."""
+        return len(self._tasks)
+
+    def _start(self, job_id: str, request: dict):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks[job_id] = self.loop.create_task(self._run(job_id, request))
+
+    def _cancel_task(self, job_id: str):
+        task = self._tasks.get(job_id)
+        if task:
+            task.cancel()
+
+    async def _run(self, job_id: str, request: dict):
+        try:
+            async with self._slots:
+                # Each transition checks the state it starts from, so a job
+                # cancelled meanwhile stays cancelled and a finished one stays finished
+                if not self.store.update(job_id, status=RUNNING, only_if=(QUEUED,)):
+                    return
+                results = await self.execute(
+                    request, lambda partial: self.store.update(job_id, results=partial, only_if=(RUNNING,))
+                )
+                self.store.update(job_id, status=DONE, results=results, only_if=(RUNNING,))
+        except asyncio.CancelledError:
+            # cancel() has already marked the job. Anything else cancelling
+            # it is a shutdown, which leaves the job to be resumed.
+            pass
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, error=str(e), only_if=(RUNNING,))
+        finally:
+            self._tasks.pop(job_id, None)
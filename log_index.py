@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Promptchad - Log index
+
+SQLite index over the JSON Lines run logs, for querying runs by date,
+provider, model or prompt and full-text searching prompts and responses
+without rescanning every log file. Indexing is incremental: each segment's
+indexed position is stored, so an update only reads entries written since
+the last one.
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from blob_store import BlobStore, unpack_entry
+from log_writer import list_segments, open_segment, segment_name
+from rate_limit import token_counts
+
+# Log lines read per indexing transaction
+INDEX_BATCH = 1000
+
+# Bumped when the schema changes; older indexes are rebuilt from the logs
+SCHEMA_VERSION = 2
+
+# Searchable texts of a run
+SEARCH_FIELDS = ("prompt", "shared_input", "response")
+
+# Snippet highlight markers, swapped for <mark> after HTML-escaping
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    shared_input_hash TEXT,
+    UNIQUE (segment, offset)
+);
+CREATE TABLE IF NOT EXISTS variants (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    variant TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT,
+    success INTEGER NOT NULL,
+    cached INTEGER NOT NULL,
+    elapsed_seconds REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+CREATE INDEX IF NOT EXISTS variants_prompt_hash ON variants (prompt_hash);
+CREATE INDEX IF NOT EXISTS results_run_id ON results (run_id);
+CREATE INDEX IF NOT EXISTS results_provider_model ON results (provider, model);
+CREATE TABLE IF NOT EXISTS texts (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS texts_fts USING fts5 (text, tokenize = 'unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS text_refs (
+    text_id INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    variant TEXT,
+    provider TEXT
+);
+CREATE INDEX IF NOT EXISTS text_refs_text_id ON text_refs (text_id, run_id);
+"""
+
+TABLES = ["segments", "runs", "variants", "results", "texts", "texts_fts", "text_refs"]
+
+
+def text_hash(text: str) -> str:
+    """Hash identifying a prompt or shared input."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def entry_variants(entry: dict) -> tuple[str, dict, dict]:
+    """Return (kind, prompts, results) for an A/B or N-variant log entry."""
+    inputs = entry.get("inputs", {})
+    outputs = entry.get("outputs", {})
+    if "prompts" in inputs:
+        return "variants", inputs["prompts"], outputs.get("results", {})
+    prompts = {"a": inputs.get("prompt_a", ""), "b": inputs.get("prompt_b", "")}
+    results = {"a": outputs.get("results_a", {}), "b": outputs.get("results_b", {})}
+    return "ab", prompts, results
+
+
+def _text_or_none(value) -> bool:
+    return value is None or isinstance(value, str)
+
+
+def is_run_entry(entry) -> bool:
+    """Whether a decoded log line has the shape of a run entry.
+
+    Lines that don't (hand-edited or foreign lines, say) are skipped like
+    lines that aren't JSON, rather than failing the whole indexing batch.
+    """
+    if not isinstance(entry, dict):
+        return False
+    if not isinstance(entry.get("inputs", {}), dict) or not isinstance(entry.get("outputs", {}), dict):
+        return False
+    if not _text_or_none(entry.get("timestamp")) or not _text_or_none(entry.get("inputs", {}).get("shared_input")):
+        return False
+    _, prompts, results = entry_variants(entry)
+    if not isinstance(prompts, dict) or not all(_text_or_none(prompt) for prompt in prompts.values()):
+        return False
+    if not isinstance(results, dict):
+        return False
+    for provider_results in results.values():
+        if not isinstance(provider_results, dict):
+            return False
+        for result in provider_results.values():
+            if not isinstance(result, dict) or not _text_or_none(result.get("response")):
+                return False
+            if not isinstance(result.get("usage") or {}, dict):
+                return False
+    return True
+
+
+def fts_query(query: str) -> str:
+    """Turn search box input into an FTS5 query matching all of its words.
+
+    Words are quoted so punctuation can't produce syntax errors; a trailing
+    `*` keeps prefix matching (`refun*`).
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
+
+
+class LogIndex:
+    """SQLite index of the runs in a log directory."""
+
+    def __init__(self, path: Path, logs_dir: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.logs_dir = logs_dir
+        self.blobs = BlobStore(logs_dir / "blobs")
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in TABLES:
+                self._db.execute(f"DROP TABLE IF EXISTS {table}")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.executescript(SCHEMA)
+
+    def update(self) -> int:
+        """Index entries written since the last update. Returns how many."""
+        with self._update_lock:
+            with self._lock:
+                known = {row["name"]: row for row in self._db.execute("SELECT * FROM segments")}
+            added = 0
+            for path in list_segments(self.logs_dir):
+                state = known.get(segment_name(path))
+                if state and state["complete"]:
+                    continue
+                added += self._index_segment(path, state["offset"] if state else 0)
+            return added
+
+    def _index_segment(self, path: Path, offset: int) -> int:
+        """Index a segment from `offset` on. Partly written last lines are left for later."""
+        name = segment_name(path)
+        # Compressed segments are never written to again
+        complete = path.suffix != ".jsonl"
+        added = 0
+        with open_segment(path, binary=True) as f:
+            f.seek(offset)
+            while True:
+                batch = []
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        complete = False
+                        break
+                    batch.append((offset, line))
+                    offset += len(line)
+                    if len(batch) == INDEX_BATCH:
+                        break
+                done = len(batch) < INDEX_BATCH
+                self._insert(name, batch, offset, complete and done)
+                added += len(batch)
+                if done:
+                    return added
+
+    def _insert(self, segment: str, lines: list[tuple[int, bytes]], offset: int, complete: bool):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for line_offset, line in lines:
+                    try:
+                        entry = unpack_entry(json.loads(line), self.blobs)
+                    except (ValueError, OSError):
+                        continue
+                    if not is_run_entry(entry):
+                        continue
+                    # A value the checks above missed skips its entry, not the batch
+                    self._db.execute("SAVEPOINT entry")
+                    try:
+                        self._insert_entry(segment, line_offset, entry)
+                    except (sqlite3.InterfaceError, sqlite3.ProgrammingError, TypeError, AttributeError):
+                        self._db.execute("ROLLBACK TO entry")
+                    self._db.execute("RELEASE entry")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO segments (name, offset, complete) VALUES (?, ?, ?)",
+                    (segment, offset, int(complete)),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _insert_entry(self, segment: str, offset: int, entry: dict):
+        kind, prompts, results = entry_variants(entry)
+        shared_input = entry.get("inputs", {}).get("shared_input")
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO runs (segment, offset, timestamp, kind, shared_input_hash) VALUES (?, ?, ?, ?, ?)",
+            (segment, offset, entry.get("timestamp", ""), kind, text_hash(shared_input) if shared_input else None),
+        )
+        if not cursor.rowcount:
+            return
+        run_id = cursor.lastrowid
+
+        self._db.executemany(
+            "INSERT INTO variants (run_id, name, prompt_hash) VALUES (?, ?, ?)",
+            [(run_id, name, text_hash(prompt or "")) for name, prompt in prompts.items()],
+        )
+        if shared_input:
+            self._insert_text(shared_input, run_id, "shared_input")
+        for name, prompt in prompts.items():
+            if prompt:
+                self._insert_text(prompt, run_id, "prompt", variant=name)
+
+        rows = []
+        for variant, provider_results in results.items():
+            for provider, result in provider_results.items():
+                if result.get("response"):
+                    self._insert_text(result["response"], run_id, "response", variant, provider)
+                input_tokens, output_tokens = token_counts(result.get("usage"))
+                rows.append((
+                    run_id,
+                    variant,
+                    provider,
+                    result.get("model"),
+                    int(bool(result.get("success"))),
+                    int(bool(result.get("cached"))),
+                    result.get("elapsed_seconds"),
+                    input_tokens,
+                    output_tokens,
+                    result.get("error"),
+                ))
+        self._db.executemany(
+            "INSERT INTO results (run_id, variant, provider, model, success, cached, elapsed_seconds, "
+            "input_tokens, output_tokens, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def _insert_text(self, text: str, run_id: int, field: str, variant: str | None = None, provider: str | None = None):
+        """Add a searchable text. Each distinct text is indexed only once."""
+        digest = text_hash(text)
+        row = self._db.execute("SELECT id FROM texts WHERE hash = ?", (digest,)).fetchone()
+        if row:
+            text_id = row["id"]
+        else:
+            text_id = self._db.execute("INSERT INTO texts (hash) VALUES (?)", (digest,)).lastrowid
+            self._db.execute("INSERT INTO texts_fts (rowid, text) VALUES (?, ?)", (text_id, text))
+        self._db.execute(
+            "INSERT INTO text_refs (text_id, run_id, field, variant, provider) VALUES (?, ?, ?, ?, ?)",
+            (text_id, run_id, field, variant, provider),
+        )
+
+    def search(self, query: str, field: str | None = None, limit: int = 20, offset: int = 0) -> list[dict]:
+        """Full-text search over prompts, shared inputs and responses.
+
+        Returns the best matching texts first, each with an HTML snippet
+        (matches wrapped in `<mark>`) and the most recent runs it appears
+        in. `field` limits matches to one of SEARCH_FIELDS.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+
+        field_filter = "AND EXISTS (SELECT 1 FROM text_refs WHERE text_id = texts_fts.rowid AND field = ?)"
+        with self._lock:
+            rows = self._db.execute(
+                f"""
+                SELECT rowid, snippet(texts_fts, 0, ?, ?, '…', 16) AS snippet, bm25(texts_fts) AS score
+                FROM texts_fts WHERE texts_fts MATCH ? {field_filter if field else ""}
+                ORDER BY score LIMIT ? OFFSET ?
+                """,
+                (_MARK_START, _MARK_END, match, *([field] if field else []), limit, offset),
+            ).fetchall()
+            hits = [self._search_hit(row, field) for row in rows]
+        return hits
+
+    def _search_hit(self, row: sqlite3.Row, field: str | None, max_runs: int = 5) -> dict:
+        refs = self._db.execute(
+            f"""
+            SELECT text_refs.*, runs.timestamp FROM text_refs JOIN runs ON runs.id = text_refs.run_id
+            WHERE text_id = ? {"AND field = ?" if field else ""}
+            ORDER BY run_id DESC LIMIT ?
+            """,
+            (row["rowid"], *([field] if field else []), max_runs),
+        ).fetchall()
+        count = self._db.execute("SELECT COUNT(*) FROM text_refs WHERE text_id = ?", (row["rowid"],)).fetchone()[0]
+        snippet = html.escape(row["snippet"]).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+        return {
+            "snippet": snippet,
+            "score": -row["score"],
+            "occurrences": count,
+            "runs": [
+                {
+                    "run_id": ref["run_id"],
+                    "timestamp": ref["timestamp"],
+                    "field": ref["field"],
+                    "variant": ref["variant"],
+                    "provider": ref["provider"],
+                }
+                for ref in refs
+            ],
+        }
+
+    def query(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        provider: str | None = None,
+        model: str | None = None,
+        prompt_hash: str | None = None,
+        cursor: int | None = None,
+        limit: int = 50,
+    ) -> tuple[list[dict], int | None]:
+        """Find runs, newest first. Returns (runs, next_cursor).
+
+        `since` and `until` are ISO dates or timestamps (`until` exclusive),
+        `prompt_hash` matches any variant's prompt and may be a prefix. Pass
+        the returned cursor back to get the next page; it is None on the
+        last page.
+        """
+        conditions, params = [], []
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        if cursor is not None:
+            conditions.append("id < ?")
+            params.append(cursor)
+        if provider or model:
+            conditions.append(
+                "id IN (SELECT run_id FROM results WHERE (? IS NULL OR provider = ?) AND (? IS NULL OR model = ?))"
+            )
+            params += [provider, provider, model, model]
+        if prompt_hash:
+            conditions.append("id IN (SELECT run_id FROM variants WHERE prompt_hash >= ? AND prompt_hash < ?)")
+            params += [prompt_hash, prompt_hash + "g"]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM runs {where} ORDER BY id DESC LIMIT ?", (*params, limit + 1)
+            ).fetchall()
+            runs = [self._run_summary(row) for row in rows[:limit]]
+        next_cursor = runs[-1]["id"] if len(rows) > limit else None
+        return runs, next_cursor
+
+    def _run_summary(self, row: sqlite3.Row) -> dict:
+        variants = {
+            v["name"]: {"prompt_hash": v["prompt_hash"], "results": {}}
+            for v in self._db.execute("SELECT * FROM variants WHERE run_id = ?", (row["id"],))
+        }
+        for r in self._db.execute("SELECT * FROM results WHERE run_id = ?", (row["id"],)):
+            variants.setdefault(r["variant"], {"prompt_hash": None, "results": {}})["results"][r["provider"]] = {
+                "model": r["model"],
+                "success": bool(r["success"]),
+                "cached": bool(r["cached"]),
+                "elapsed_seconds": r["elapsed_seconds"],
+                "input_tokens": r["input_tokens"],
+                "output_tokens": r["output_tokens"],
+                "error": r["error"],
+            }
+        return {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "kind": row["kind"],
+            "shared_input_hash": row["shared_input_hash"],
+            "variants": variants,
+        }
+
+    def entry(self, run_id: int) -> dict | None:
+        """Read a run's full log entry back from its segment."""
+        with self._lock:
+            row = self._db.execute("SELECT segment, offset FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        for path in list_segments(self.logs_dir):
+            if segment_name(path) == row["segment"]:
+                with open_segment(path, binary=True) as f:
+                    f.seek(row["offset"])
+                    return unpack_entry(json.loads(f.readline()), self.blobs)
+        return None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the index of promptchad's run logs")
+    parser.add_argument("--logs", type=Path, default=Path("logs"), help="Log directory (default: logs)")
+    parser.add_argument("--db", type=Path, help="Index database (default: <logs>/index.db)")
+    args = parser.parse_args()
+
+    index = LogIndex(args.db or args.logs / "index.db", args.logs)
+    print(f"Indexed {index.update()} new runs")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Promptchad - Log writer
+
+Background writer for the JSON Lines run logs. Entries are queued by request
+threads and written in batches by a single thread holding the only file
+handle, so logging never blocks a request and lines never interleave.
+
+Logs go to one file per day (`2025-01-15.jsonl`). A day that outgrows
+`max_size_mb` continues in numbered segments (`2025-01-15.1.jsonl`, ...), and
+segments that are finished with are compressed (`2025-01-15.jsonl.gz`).
+
+With `format = "dedup"` input texts and config snapshots go to a blob store
+in `blobs/` and entries only reference them; see blob_store.py.
+"""
+
+import gzip
+import json
+import queue
+import re
+import shutil
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from blob_store import BlobStore, pack_entry
+
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+# "full" writes entries as they are, "dedup" moves repeated content to blobs
+FORMATS = ("full", "dedup")
+
+# Entries written per batch before flushing
+BATCH_SIZE = 256
+
+SEGMENT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.jsonl(\.gz|\.zst)?$")
+
+_STOP = object()
+
+
+def _zstd():
+    """The stdlib zstd module (Python 3.14+)."""
+    try:
+        from compression import zstd
+    except ImportError:
+        raise ValueError("zstd log compression needs Python 3.14 or newer") from None
+    return zstd
+
+
+def check_settings(max_size_mb, compress: str, format: str):
+    """Raise ValueError unless these are usable LogWriter settings."""
+    if not isinstance(max_size_mb, int | float) or isinstance(max_size_mb, bool) or max_size_mb <= 0:
+        raise ValueError(f"Log segment size must be a positive number of MB, not {max_size_mb!r}")
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"Unknown log compression {compress!r} (expected one of {', '.join(COMPRESSIONS)})")
+    if format not in FORMATS:
+        raise ValueError(f"Unknown log format {format!r} (expected one of {', '.join(FORMATS)})")
+    if compress == "zstd":
+        _zstd()
+
+
+def parse_segment(path: Path) -> tuple[str, int] | None:
+    """Return (day, index) for a log segment file name, or None."""
+    match = SEGMENT_RE.match(path.name)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2) or 0)
+
+
+def segment_name(path: Path) -> str:
+    """Segment name without the compression suffix, stable across compression."""
+    return path.name.removesuffix(".gz").removesuffix(".zst")
+
+
+def open_segment(path: Path, binary: bool = False):
+    """Open a log segment for reading, compressed or not.
+
+    Offsets into a compressed segment are offsets into its uncompressed
+    data, so they stay valid when a segment is compressed.
+    """
+    if path.suffix == ".gz":
+        opener = gzip.open
+    elif path.suffix == ".zst":
+        opener = _zstd().open
+    else:
+        opener = open
+    return opener(path, "rb") if binary else opener(path, "rt", encoding="utf-8")
+
+
+def list_segments(directory: Path) -> list[Path]:
+    """All log segments in a directory, oldest first."""
+    segments = [(parse_segment(p), p) for p in directory.glob("*.jsonl*")]
+    return [p for key, p in sorted((k, p) for k, p in segments if k)]
+
+
+class LogWriter:
+    """Queue-fed writer thread for the daily JSON Lines logs.
+
+    `write()` only enqueues the entry; serialization, rotation and
+    compression happen on the writer thread. Entries must not be modified
+    after they are handed over.
+    """
+
+    def __init__(self, directory: Path, max_size_mb: float = 100, compress: str = "gzip", format: str = "full"):
+        check_settings(max_size_mb, compress, format)
+        self.directory = directory
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.compress = compress
+        self.blobs = BlobStore(directory / "blobs") if format == "dedup" else None
+        self._queue = queue.Queue()
+        self._file = None
+        self._day = None
+        self._index = 0
+        self._thread = threading.Thread(target=self._run, name="promptchad-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, entry: dict):
+        """Queue an entry to be appended to the log."""
+        self._queue.put(entry)
+
+    def pending(self) -> int:
+        """Entries queued but not yet written."""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block until every queued entry has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write out queued entries and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._compress_closed()
+        except OSError as e:
+            # Keep draining the queue so flush() returns; each batch reports its own error
+            print(f"Error preparing log directory {self.directory}: {e}", file=sys.stderr)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(entry is _STOP for entry in batch)
+            try:
+                self._write_batch([entry for entry in batch if entry is not _STOP])
+            except Exception as e:
+                print(f"Error writing log entries: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                if self._file:
+                    self._file.close()
+                return
+
+    def _write_batch(self, entries: list[dict]):
+        for entry in entries:
+            try:
+                if self.blobs:
+                    entry = pack_entry(entry, self.blobs)
+                line = (json.dumps(entry) + "\n").encode("utf-8")
+            except (TypeError, ValueError, OSError) as e:
+                # Skip just this entry; the rest of the batch is still written
+                print(f"Error writing log entry from {entry.get('timestamp', '?')}: {e}", file=sys.stderr)
+                continue
+            self._segment_for(len(line)).write(line)
+        if self._file:
+            self._file.flush()
+
+    def _segment_for(self, size: int):
+        """The open file for today's log, rotating by day and size first."""
+        day = datetime.now().strftime("%Y-%m-%d")
+        if day != self._day:
+            self._close_segment()
+            self._day = day
+            self._index = self._last_index(day)
+        elif self._file and self._file.tell() and self._file.tell() + size > self.max_bytes:
+            self._close_segment()
+            self._index += 1
+
+        if self._file is None:
+            path = self._path(self._day, self._index)
+            if not path.exists() and any(path.with_name(path.name + s).exists() for s in (".gz", ".zst")):
+                # Today's latest segment was already compressed; start a new one
+                self._index += 1
+                path = self._path(self._day, self._index)
+            self._file = open(path, "ab")
+        return self._file
+
+    def _path(self, day: str, index: int) -> Path:
+        return self.directory / (f"{day}.jsonl" if index == 0 else f"{day}.{index}.jsonl")
+
+    def _last_index(self, day: str) -> int:
+        """Index of the newest existing segment for a day (0 if there is none)."""
+        indexes = [index for d, index in map(parse_segment, list_segments(self.directory)) if d == day]
+        return max(indexes, default=0)
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._compress(self._path(self._day, self._index))
+
+    def _compress_closed(self):
+        """Compress uncompressed segments left behind by earlier runs."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        latest = self._last_index(today)
+        for path in list_segments(self.directory):
+            day, index = parse_segment(path)
+            if path.suffix == ".jsonl" and (day != today or index < latest):
+                self._compress(path)
+
+    def _compress(self, path: Path):
+        """Replace a closed segment with its compressed copy."""
+        if self.compress == "none" or not path.exists():
+            return
+        target = path.with_name(path.name + COMPRESSIONS[self.compress])
+        tmp = target.with_name(target.name + ".tmp")
+        opener = gzip.open if self.compress == "gzip" else _zstd().open
+        try:
+            with open(path, "rb") as src, opener(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            tmp.replace(target)
+            path.unlink()
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            print(f"Error compressing log segment {path}: {e}", file=sys.stderr)
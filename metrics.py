@@ -0,0 +1,170 @@
+"""
+Promptchad - Metrics
+
+In-process counters, gauges and histograms rendered in the Prometheus text
+format. Recording a value only takes a short lock and a dict update; all
+formatting happens when the metrics are scraped.
+"""
+
+import bisect
+import threading
+from collections.abc import Callable
+
+from rate_limit import token_counts
+
+# Latency buckets in seconds, from cache hits to slow long generations
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base class: a named metric with a fixed set of label names."""
+
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a function when scraped."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), function: Callable[[], float] | None = None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> list[str]:
+        if self.function is None:
+            return super().render()
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", f"{self.name} {self.function()}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # Per-bucket counts (plus +Inf), then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = {labels: list(counts) for labels, counts in self._values.items()}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The set of metrics exported together."""
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+provider_calls = REGISTRY.register(Counter(
+    "promptchad_provider_calls_total",
+    "Provider calls by outcome (success, error or cached)",
+    ("provider", "model", "outcome"),
+))
+provider_latency = REGISTRY.register(Histogram(
+    "promptchad_provider_call_seconds",
+    "Total provider call time, including rate limiting and retries",
+    ("provider", "model"),
+))
+provider_tokens = REGISTRY.register(Counter(
+    "promptchad_provider_tokens_total",
+    "Tokens sent to (in) and generated by (out) providers",
+    ("provider", "model", "direction"),
+))
+cache_lookups = REGISTRY.register(Counter(
+    "promptchad_cache_lookups_total",
+    "Response cache lookups by result (hit or miss)",
+    ("result",),
+))
+
+
+def record_call(provider: str, config: dict, result: dict):
+    """Record a finished provider call, labelled with the configured model."""
+    model = config.get("model") or result.get("model") or ""
+    if result.get("cached"):
+        outcome = "cached"
+    else:
+        outcome = "success" if result.get("success") else "error"
+    provider_calls.inc(provider, model, outcome)
+    if outcome == "cached":
+        return
+
+    total = result.get("timings", {}).get("total_seconds")
+    if total is not None:
+        provider_latency.observe(total, provider, model)
+    input_tokens, output_tokens = token_counts(result.get("usage"))
+    if input_tokens:
+        provider_tokens.inc(provider, model, "in", amount=input_tokens)
+    if output_tokens:
+        provider_tokens.inc(provider, model, "out", amount=output_tokens)
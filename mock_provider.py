@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Promptchad - Mock provider server
+
+Local stand-in for the OpenAI, Anthropic and Gemini APIs, for testing and
+load-testing promptchad without API keys. Speaks the chat completions,
+messages and generateContent wire formats (including streaming) with
+configurable latency, token rate and error injection.
+
+Point providers at it with `base_url` in config.toml:
+
+    [providers.openai]      base_url = "http://127.0.0.1:8100/v1"
+    [providers.anthropic]   base_url = "http://127.0.0.1:8100"
+    [providers.google]      base_url = "http://127.0.0.1:8100/v1beta"
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+WORDS = "the quick brown fox jumps over a lazy dog while promptchad counts tokens".split()
+
+GEMINI_PATH = re.compile(r"^/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)$")
+
+
+@dataclass
+class MockSettings:
+    """How the mock server behaves."""
+
+    latency: float = 0.0  # Mean seconds before the first byte of a response
+    latency_dist: str = "fixed"  # fixed, uniform, exponential or lognormal
+    token_rate: float = 0.0  # Output tokens per second; 0 generates instantly
+    output_tokens: int = 50
+    error_rate: float = 0.0  # Fraction of requests failing with a 500
+    rate_limit_rate: float = 0.0  # Fraction of requests failing with a 429
+    timeout_rate: float = 0.0  # Fraction of requests that hang for hang_seconds
+    hang_seconds: float = 600.0
+    retry_after: float = 1.0  # Retry-After sent with 429 responses
+    seed: int | None = None
+    rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.rng = random.Random(self.seed)
+
+    def sample_latency(self) -> float:
+        """Draw a time-to-first-byte from the configured distribution."""
+        if self.latency <= 0:
+            return 0.0
+        if self.latency_dist == "uniform":
+            return self.rng.uniform(0, 2 * self.latency)
+        if self.latency_dist == "exponential":
+            return self.rng.expovariate(1 / self.latency)
+        if self.latency_dist == "lognormal":
+            # Median of latency with a long right tail
+            return self.rng.lognormvariate(0, 0.75) * self.latency
+        return self.latency
+
+    def sample_fault(self) -> str | None:
+        """Pick the failure to inject into a request, if any."""
+        roll = self.rng.random()
+        for fault, rate in (
+            ("rate_limit", self.rate_limit_rate),
+            ("error", self.error_rate),
+            ("timeout", self.timeout_rate),
+        ):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+
+class Request:
+    """A parsed HTTP request."""
+
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = url.query
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> dict:
+        return json.loads(self.body or b"{}")
+
+
+class Response:
+    """Writes an HTTP response, either whole or as a chunked stream."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def send(self, status: int, body: dict, headers: dict | None = None):
+        data = json.dumps(body).encode()
+        head = {"Content-Type": "application/json", "Content-Length": str(len(data)), **(headers or {})}
+        self.writer.write(self._head(status, head) + data)
+        await self.writer.drain()
+
+    async def start_stream(self):
+        head = {"Content-Type": "text/event-stream", "Transfer-Encoding": "chunked"}
+        self.writer.write(self._head(200, head))
+        await self.writer.drain()
+
+    async def event(self, data: dict | str, event: str | None = None):
+        payload = data if isinstance(data, str) else json.dumps(data)
+        text = (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+        chunk = text.encode()
+        self.writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        await self.writer.drain()
+
+    async def end_stream(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+    @staticmethod
+    def _head(status: int, headers: dict) -> bytes:
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+        lines = [f"HTTP/1.1 {status} {reason.get(status, 'Unknown')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+class MockProvider:
+    """Request handling for all three provider APIs."""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.requests = 0
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while request := await self._read_request(reader):
+                await self.handle(request, Response(writer))
+                if request.headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Server shutdown. Ending quietly keeps asyncio from logging each
+            # cancelled connection as an error.
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, target, _ = line.decode().split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return Request(method, target, headers, body)
+
+    async def handle(self, request: Request, response: Response):
+        self.requests += 1
+
+        if request.method == "POST" and request.path == "/v1/chat/completions":
+            api = "openai"
+        elif request.method == "POST" and request.path == "/v1/messages":
+            api = "anthropic"
+        elif request.method == "POST" and GEMINI_PATH.match(request.path):
+            api = "google"
+        else:
+            await response.send(404, {"error": {"message": f"No route for {request.method} {request.path}"}})
+            return
+
+        body = request.json()
+        fault = self.settings.sample_fault()
+        await asyncio.sleep(self.settings.sample_latency())
+
+        if fault == "timeout":
+            await asyncio.sleep(self.settings.hang_seconds)
+            return
+        if fault:
+            await self._send_error(api, response, fault)
+            return
+
+        await getattr(self, f"_{api}")(request, body, response)
+
+    async def _send_error(self, api: str, response: Response, fault: str):
+        status = 429 if fault == "rate_limit" else 500
+        message = "Rate limit exceeded (mock)" if status == 429 else "Internal server error (mock)"
+        headers = {"Retry-After": str(self.settings.retry_after)} if status == 429 else {}
+        if api == "anthropic":
+            kind = "rate_limit_error" if status == 429 else "api_error"
+            body = {"type": "error", "error": {"type": kind, "message": message}}
+        elif api == "google":
+            body = {"error": {"code": status, "message": message, "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"}}
+        else:
+            body = {"error": {"message": message, "type": "rate_limit_error" if status == 429 else "server_error"}}
+        await response.send(status, body, headers)
+
+    def _tokens(self, max_tokens: int | None) -> list[str]:
+        count = min(self.settings.output_tokens, max_tokens or self.settings.output_tokens)
+        return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+    async def _generate(self, tokens: list[str]):
+        """Yield output tokens at the configured rate."""
+        delay = 1 / self.settings.token_rate if self.settings.token_rate else 0
+        for token in tokens:
+            if delay:
+                await asyncio.sleep(delay)
+            yield token
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+    async def _openai(self, request: Request, body: dict, response: Response):
+        model = body.get("model", "mock-gpt")
+        prompt_tokens = self._count_tokens(json.dumps(body.get("messages", [])))
+        tokens = self._tokens(body.get("max_completion_tokens") or body.get("max_tokens"))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        base = {"id": f"chatcmpl-mock-{self.requests}", "created": int(time.time()), "model": model}
+
+        if not body.get("stream"):
+            text = "".join([t async for t in self._generate(tokens)])
+            await response.send(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        chunk = {**base, "object": "chat.completion.chunk"}
+        await response.start_stream()
+        async for token in self._generate(tokens):
+            await response.event({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        await response.event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if body.get("stream_options", {}).get("include_usage"):
+            await response.event({**chunk, "choices": [], "usage": usage})
+        await response.event("[DONE]")
+        await response.end_stream()
+
+    async def _anthropic(self, request: Request, body: dict, response: Response):
+        model = body.get("model", "mock-claude")
+        input_tokens = self._count_tokens(json.dumps(body.get("messages", [])))
+        tokens = self._tokens(body.get("max_tokens"))
+        message = {
+            "id": f"msg_mock_{self.requests}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "stop_sequence": None,
+        }
+
+        if not body.get("stream"):
+            text = "".join([t async for t in self._generate(tokens)])
+            await response.send(200, {
+                **message,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": input_tokens, "output_tokens": len(tokens)},
+            })
+            return
+
+        await response.start_stream()
+        await response.event({
+            "type": "message_start",
+            "message": {**message, "content": [], "stop_reason": None, "usage": {"input_tokens": input_tokens, "output_tokens": 0}},
+        }, "message_start")
+        await response.event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        async for token in self._generate(tokens):
+            await response.event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}, "content_block_delta")
+        await response.event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        await response.event({
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(tokens)},
+        }, "message_delta")
+        await response.event({"type": "message_stop"}, "message_stop")
+        await response.end_stream()
+
+    async def _google(self, request: Request, body: dict, response: Response):
+        model, method = GEMINI_PATH.match(request.path).groups()
+        prompt_tokens = self._count_tokens(json.dumps(body.get("contents", [])))
+        tokens = self._tokens(body.get("generationConfig", {}).get("maxOutputTokens"))
+        usage = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": len(tokens),
+            "totalTokenCount": prompt_tokens + len(tokens),
+        }
+
+        def chunk(text: str, done: bool) -> dict:
+            candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+            data = {"candidates": [{**candidate, "finishReason": "STOP"} if done else candidate], "modelVersion": model}
+            if done:
+                data["usageMetadata"] = usage
+            return data
+
+        if method == "generateContent":
+            text = "".join([t async for t in self._generate(tokens)])
+            await response.send(200, chunk(text, done=True))
+            return
+
+        await response.start_stream()
+        async for token in self._generate(tokens):
+            await response.event(chunk(token, done=False))
+        await response.event(chunk("", done=True))
+        await response.end_stream()
+
+
+async def start_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 8100) -> asyncio.Server:
+    """Start the mock server on the running event loop."""
+    provider = MockProvider(settings)
+    return await asyncio.start_server(provider.handle_connection, host, port, backlog=4096)
+
+
+def serve_in_thread(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> tuple[str, Callable[[], None]]:
+    """Run the mock server on a background thread.
+
+    Returns the server's root URL and a function that stops it.
+    """
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    holder = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        holder["server"] = loop.run_until_complete(start_server(settings, host, port))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+
+    async def shutdown():
+        server = holder["server"]
+        server.close()
+        # Connection handlers still running (e.g. hung by timeout_rate) would
+        # otherwise be destroyed pending, with their sockets left open
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await server.wait_closed()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    bound_port = holder["server"].sockets[0].getsockname()[1]
+    return f"http://{host}:{bound_port}", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI/Anthropic/Gemini server")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8100, help="Port to bind (default: 8100)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean seconds to first byte (default: 0)")
+    parser.add_argument(
+        "--latency-dist",
+        choices=["fixed", "uniform", "exponential", "lognormal"],
+        default="fixed",
+        help="Latency distribution (default: fixed)",
+    )
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Output tokens per second, 0 for instant (default: 0)")
+    parser.add_argument("--output-tokens", type=int, default=50, help="Tokens per response (default: 50)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that never answer")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s (default: 1)")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        latency=args.latency,
+        latency_dist=args.latency_dist,
+        token_rate=args.token_rate,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+    async def serve():
+        server = await start_server(settings, args.host, args.port)
+        print(f"Mock provider listening on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Promptchad - Profiling
+
+Profilers for a CLI run (`--profile`) or a window of a live server
+(`/debug/profile`):
+
+- cpu: cProfile for a run, saved as a pstats dump; for a live server,
+  sampled stacks of every thread in collapsed (flamegraph) format
+- async: event loop callbacks that blocked the loop, slowest first
+- memory: a tracemalloc snapshot for a run, or the allocation growth over
+  the sampling window
+
+The profilers are imported when used, so importing this module stays cheap.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_MODES = ("cpu", "async", "memory")
+PROFILE_SUFFIXES = {"cpu": ".prof", "async": ".txt", "memory": ".tracemalloc"}
+
+# Event loop callbacks running at least this long are reported as slow
+SLOW_CALLBACK_SECONDS = 0.01
+# Interval between stack samples of a live server
+SAMPLE_INTERVAL = 0.005
+# Frames kept per allocation traceback
+MEMORY_FRAMES = 25
+REPORT_LINES = 30
+
+
+def default_profile_path(mode: str) -> Path:
+    """File name for a run's profile, e.g. profile-cpu-20250115-103000.prof."""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return Path(f"profile-{mode}-{stamp}{PROFILE_SUFFIXES[mode]}")
+
+
+def _describe_callback(callback) -> str:
+    """Name an event loop callback, by coroutine for task steps."""
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        coro = owner.get_coro()
+        return f"task {getattr(coro, '__qualname__', repr(coro))}"
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+class SlowCallbackMonitor:
+    """Times every event loop callback, on all loops, while installed.
+
+    Works like asyncio's debug mode `slow_callback_duration` warning, but
+    collects totals per callback instead of logging each one.
+    """
+
+    def __init__(self, threshold: float = SLOW_CALLBACK_SECONDS):
+        self.threshold = threshold
+        self.callbacks = 0
+        self.slow = defaultdict(lambda: [0, 0.0, 0.0])  # name -> [count, total, max]
+        self._lock = threading.Lock()
+        self._original = None
+
+    def install(self):
+        original = self._original = asyncio.Handle._run
+        monitor = self
+
+        def _run(handle):
+            start = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                monitor._record(handle, time.perf_counter() - start)
+
+        asyncio.Handle._run = _run
+
+    def uninstall(self):
+        if self._original is not None:
+            asyncio.Handle._run = self._original
+            self._original = None
+
+    def _record(self, handle, elapsed: float):
+        with self._lock:
+            self.callbacks += 1
+            if elapsed < self.threshold:
+                return
+            stats = self.slow[_describe_callback(handle._callback)]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+    def report(self) -> str:
+        with self._lock:
+            slow = sorted(self.slow.items(), key=lambda item: item[1][1], reverse=True)
+            callbacks = self.callbacks
+        lines = [
+            f"{callbacks} event loop callbacks, {sum(s[0] for _, s in slow)} took "
+            f"{self.threshold * 1000:g} ms or more",
+            "",
+            f"{'count':>7} {'total s':>9} {'max ms':>9}  callback",
+        ]
+        for name, (count, total, longest) in slow:
+            lines.append(f"{count:>7} {total:>9.3f} {longest * 1000:>9.1f}  {name}")
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile(mode: str | None, path: Path | None = None):
+    """Profile the enclosed block and save the result; a no-op if `mode` is None.
+
+    A short summary is printed to stderr along with where the full profile
+    was saved.
+    """
+    if mode is None:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r} (expected one of {', '.join(PROFILE_MODES)})")
+    path = path or default_profile_path(mode)
+
+    if mode == "cpu":
+        import cProfile
+        import io
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(REPORT_LINES)
+            print(summary.getvalue(), file=sys.stderr)
+    elif mode == "async":
+        monitor = SlowCallbackMonitor()
+        monitor.install()
+        try:
+            yield
+        finally:
+            monitor.uninstall()
+            report = monitor.report()
+            path.write_text(report)
+            print(report, file=sys.stderr)
+    else:
+        import tracemalloc
+
+        tracemalloc.start(MEMORY_FRAMES)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(path)
+            print(f"Memory: {current / 1e6:.1f} MB allocated at exit, {peak / 1e6:.1f} MB peak", file=sys.stderr)
+            for stat in snapshot.statistics("lineno")[:REPORT_LINES]:
+                print(stat, file=sys.stderr)
+
+    print(f"Saved {mode} profile to {path}", file=sys.stderr)
+
+
+def sample_stacks(seconds: float, interval: float = SAMPLE_INTERVAL) -> str:
+    """Sample every thread's stack for a while.
+
+    Returns collapsed stacks ("thread;outer;...;inner count" per line), the
+    input format of flamegraph.pl and speedscope.
+    """
+    me = threading.get_ident()
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def sample_slow_callbacks(seconds: float) -> str:
+    """Report event loop callbacks that were slow over the next `seconds`."""
+    monitor = SlowCallbackMonitor()
+    monitor.install()
+    try:
+        time.sleep(seconds)
+    finally:
+        monitor.uninstall()
+    return monitor.report()
+
+
+def sample_memory(seconds: float) -> str:
+    """Report where memory allocated over the next `seconds` went."""
+    import tracemalloc
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(MEMORY_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    lines = [f"Top allocation growth over {seconds:g}s", ""]
+    lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[:REPORT_LINES])
+    return "\n".join(lines) + "\n"
+
+
+SAMPLERS = {"cpu": sample_stacks, "async": sample_slow_callbacks, "memory": sample_memory}
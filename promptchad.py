@@ -7,22 +7,457 @@ Test prompts across multiple AI providers and compare results.
 
 import argparse
 import asyncio
+import contextvars
+import csv
+import importlib
 import json
 import sys
+import threading
 import time
+from collections.abc import AsyncIterator, Iterable, Iterator, Mapping
 from pathlib import Path
 from typing import Any
 
-import toml
+import metrics
+import tracing
+from config_manager import ConfigError, get_config_manager
+from daemon import DaemonUnavailable, default_socket_path, forward, serve_main
+from hedging import Hedger
+from profiling import PROFILE_MODES, profile
+from rate_limit import RateLimiter, estimate_tokens, token_counts, used_tokens
+from response_cache import CACHE_MODES, ResponseCache, cache_key
+from retries import RetryPolicy, error_result
+
+
+# Connection pool bounds for shared provider clients. Override per provider
+# with `max_connections` / `max_keepalive_connections` in config.toml.
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Warm provider clients keyed by (provider, api_key, base_url). Their connection
+# pools are bound to the event loop that created them, so the registry is tied
+# to a single loop and must be closed with `close_clients()` before it exits.
+_clients: dict[tuple, Any] = {}
+_clients_loop: asyncio.AbstractEventLoop | None = None
+
+
+# Timing of the provider request made by the current task. Provider calls
+# start it, and the HTTP clients' response hook records when headers arrive.
+_request_timing: contextvars.ContextVar[dict | None] = contextvars.ContextVar("request_timing", default=None)
+
+
+def _start_timing() -> dict:
+    """Start timing a provider request made from the current task."""
+    timing = {"start": time.monotonic()}
+    _request_timing.set(timing)
+    return timing
+
+
+async def _record_first_byte(response):
+    """httpx response hook: note when the first response headers arrived."""
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.setdefault("first_byte", time.monotonic())
+
+
+TIMING_HOOKS = {"response": [_record_first_byte]}
+
+
+def _request_timings(timing: dict, first_token: float | None = None) -> dict:
+    """Monotonic timings of one provider request, in seconds from its start."""
+    timings = {"request_seconds": round(time.monotonic() - timing["start"], 4)}
+    if "first_byte" in timing:
+        timings["ttfb_seconds"] = round(timing["first_byte"] - timing["start"], 4)
+    if first_token is not None:
+        timings["ttft_seconds"] = round(first_token - timing["start"], 4)
+    return timings
+
+
+def _pool_limits(limits_type, config: dict):
+    """Build connection pool limits for a provider from its config."""
+    return limits_type(
+        max_connections=config.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=config.get(
+            "max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+        ),
+    )
+
+
+_ssl_context = None
+
+
+def shared_ssl_context():
+    """The TLS settings shared by every provider client.
+
+    Loading the CA bundle takes tens of milliseconds, and httpx would
+    otherwise do it again for each client.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        import httpx
+
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def _http_client(sdk, config: dict):
+    """Create a pooled HTTP client for a provider SDK.
+
+    The SDK's own default client class is used so that its timeouts and
+    transport settings are kept; only the pool bounds are changed.
+    """
+    limits_type = type(sdk.DEFAULT_CONNECTION_LIMITS)
+    return sdk.DefaultAsyncHttpxClient(
+        limits=_pool_limits(limits_type, config),
+        event_hooks=TIMING_HOOKS,
+        verify=shared_ssl_context(),
+    )
+
+
+# Seconds spent importing each provider SDK (and httpx), shown by `--timing`
+sdk_import_seconds: dict[str, float] = {}
+
+
+def import_sdk(name: str):
+    """Import a provider SDK or httpx, recording how long it took."""
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    sdk_import_seconds[name] = max(sdk_import_seconds.get(name, 0.0), elapsed)
+    return module
+
+
+def prefetch_sdks(config: dict) -> threading.Thread | None:
+    """Start importing what enabled providers need on a background thread.
+
+    SDKs take far longer to import than the rest of the CLI, so this
+    overlaps their import with reading prompts and starting the event loop,
+    instead of blocking the loop on the first call to each provider. Every
+    client uses httpx, so it comes first, along with the transport it loads
+    lazily (httpcore) and the shared TLS context.
+    """
+    enabled = {
+        name: provider_config
+        for name, provider_config in config.get("providers", {}).items()
+        if provider_config.get("enabled", True)
+    }
+    if not enabled:
+        return None
+    modules = ["httpx", "httpcore"] + [
+        PROVIDER_SDKS[name] for name, provider_config in enabled.items() if uses_sdk(name, provider_config)
+    ]
+
+    def run():
+        for module in modules:
+            try:
+                import_sdk(module)
+            except ImportError:
+                pass  # Reported as an error result when a provider is called
+            if module == "httpcore":
+                shared_ssl_context()
+
+    thread = threading.Thread(target=run, name="promptchad-sdk-import", daemon=True)
+    thread.start()
+    return thread
+
+
+def _new_openai_client(config: dict):
+    openai = import_sdk("openai")
+
+    return openai.AsyncOpenAI(
+        api_key=config["api_key"],
+        base_url=config.get("base_url"),
+        http_client=_http_client(openai, config),
+        max_retries=0,  # Retries are handled by call_provider()
+    )
+
+
+def _new_anthropic_client(config: dict):
+    anthropic = import_sdk("anthropic")
+
+    return anthropic.AsyncAnthropic(
+        api_key=config["api_key"],
+        base_url=config.get("base_url"),
+        http_client=_http_client(anthropic, config),
+        max_retries=0,  # Retries are handled by call_provider()
+    )
+
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+ANTHROPIC_BASE_URL = "https://api.anthropic.com"
+ANTHROPIC_VERSION = "2023-06-01"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+
+def _raise_for_api_error(response):
+    """Raise an HTTPStatusError carrying the API's error message."""
+    import httpx
+
+    if not response.is_error:
+        return
+    try:
+        message = response.json()["error"]["message"]
+    except Exception:
+        message = response.text
+    raise httpx.HTTPStatusError(
+        f"Error code: {response.status_code} - {message}",
+        request=response.request,
+        response=response,
+    )
+
+
+class HTTPClient:
+    """Pooled JSON-over-HTTP client for a provider's REST API.
+
+    Base of the raw-HTTP provider clients, which only need httpx and so
+    avoid the cost of importing a provider SDK.
+    """
+
+    def __init__(self, config: dict, base_url: str, headers: dict):
+        import httpx
+
+        self._http = httpx.AsyncClient(
+            base_url=config.get("base_url") or base_url,
+            headers=headers,
+            limits=_pool_limits(httpx.Limits, config),
+            timeout=httpx.Timeout(600.0, connect=5.0),
+            event_hooks=TIMING_HOOKS,
+            verify=shared_ssl_context(),
+        )
+
+    async def post(self, path: str, body: dict) -> dict:
+        """POST a request body and return the decoded response body."""
+        response = await self._http.post(path, json=body)
+        _raise_for_api_error(response)
+        return response.json()
+
+    async def stream(self, path: str, body: dict, params: dict | None = None) -> AsyncIterator[dict]:
+        """POST a request body, yielding each decoded Server-Sent Events message."""
+        async with self._http.stream("POST", path, params=params, json=body) as response:
+            if response.is_error:
+                await response.aread()
+            _raise_for_api_error(response)
+            async for line in response.aiter_lines():
+                if line.startswith("data:") and line[5:].strip() != "[DONE]":
+                    yield json.loads(line[5:])
+
+    async def close(self):
+        await self._http.aclose()
+
+
+class GeminiClient(HTTPClient):
+    """Minimal async client for the Gemini `generateContent` REST API.
+
+    Talks to the API directly over a pooled httpx client instead of going
+    through `google.generativeai`, which keeps the API key in global state
+    and only offers blocking calls.
+    """
+
+    def __init__(self, config: dict):
+        super().__init__(config, GEMINI_BASE_URL, {"x-goog-api-key": config["api_key"]})
+
+    async def generate_content(self, model: str, prompt: str, generation_config: dict) -> dict:
+        """Generate a completion and return the decoded response body."""
+        return await self.post(
+            f"/models/{model}:generateContent",
+            {
+                "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                "generationConfig": generation_config,
+            },
+        )
+
+    async def stream_generate_content(
+        self, model: str, prompt: str, generation_config: dict
+    ) -> AsyncIterator[dict]:
+        """Generate a completion, yielding each decoded response chunk."""
+        async for data in self.stream(
+            f"/models/{model}:streamGenerateContent",
+            {
+                "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                "generationConfig": generation_config,
+            },
+            params={"alt": "sse"},
+        ):
+            yield data
+
+
+class OpenAIHTTPClient(HTTPClient):
+    """Raw-HTTP client for the OpenAI Chat Completions API (`client = "http"`)."""
+
+    def __init__(self, config: dict):
+        super().__init__(config, OPENAI_BASE_URL, {"Authorization": f"Bearer {config['api_key']}"})
+
+
+class AnthropicHTTPClient(HTTPClient):
+    """Raw-HTTP client for the Anthropic Messages API (`client = "http"`)."""
+
+    def __init__(self, config: dict):
+        super().__init__(
+            config,
+            ANTHROPIC_BASE_URL,
+            {"x-api-key": config["api_key"], "anthropic-version": ANTHROPIC_VERSION},
+        )
+
+
+CLIENT_FACTORIES = {
+    "openai": _new_openai_client,
+    "anthropic": _new_anthropic_client,
+    "google": GeminiClient,
+    "openai_http": OpenAIHTTPClient,
+    "anthropic_http": AnthropicHTTPClient,
+}
+
+
+def get_client(provider: str, config: dict):
+    """Return a warm client for the provider, creating it on first use."""
+    global _clients_loop
+
+    loop = asyncio.get_running_loop()
+    if _clients_loop is not loop:
+        # Clients from a previous loop hold dead connections; drop them.
+        _clients.clear()
+        _clients_loop = loop
+
+    key = (provider, config["api_key"], config.get("base_url"))
+    client = _clients.get(key)
+    if client is None:
+        client = CLIENT_FACTORIES[provider](config)
+        _clients[key] = client
+    return client
+
+
+async def close_clients():
+    """Close all pooled clients and release their connections."""
+    global _clients_loop
+
+    clients = list(_clients.values())
+    _clients.clear()
+    _clients_loop = None
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+def run_async(coro):
+    """Run a coroutine on a fresh event loop, closing pooled clients afterwards."""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_clients()
+
+    return asyncio.run(runner())
+
+
+async def _shutdown():
+    """Cancel every other task on the running loop, then close pooled clients."""
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_clients()
+
+
+class EventLoopThread:
+    """A long-lived event loop on a background thread.
+    
+    Lets synchronous code such as Flask request handlers share one loop,
+    and with it the warm provider clients and connection pools, instead of
+    starting a fresh loop per call. The thread starts on first use.
+    """
+    
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="promptchad-loop", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+    
+    def run(self, coro):
+        """Run a coroutine on the loop and wait for its result."""
+        future = asyncio.run_coroutine_threadsafe(tracing.in_current_span(coro), self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+    
+    def iterate(self, stream: AsyncIterator):
+        """Drive an async iterator on the loop from synchronous code."""
+        async def next_item():
+            return await anext(stream)
+        
+        async def close():
+            await stream.aclose()
+        
+        try:
+            while True:
+                try:
+                    item = self.run(next_item())
+                except StopAsyncIteration:
+                    break
+                yield item
+        finally:
+            self.run(close())
+    
+    def close(self):
+        """Cancel outstanding work, close pooled clients and stop the loop."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=10)
+
+
+# Result shaping shared by the SDK and raw-HTTP provider functions. SDK
+# responses are objects and HTTP responses parsed JSON; both go through
+# `_pick` so the two clients return identical results.
+
+OPENAI_USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+ANTHROPIC_USAGE_FIELDS = ("input_tokens", "output_tokens")
+
+
+def _pick(data, fields: tuple[str, ...]) -> dict:
+    """Named fields of a parsed JSON object or an SDK response object."""
+    if isinstance(data, Mapping):
+        return {name: data.get(name) for name in fields}
+    return {name: getattr(data, name, None) for name in fields}
+
+
+def _anthropic_text(content) -> str:
+    """Join the text blocks of an Anthropic message."""
+    blocks = (_pick(block, ("type", "text")) for block in content)
+    return "".join(block["text"] or "" for block in blocks if block["type"] == "text")
+
+
+def _success_result(text: str, model: str, usage: dict | None, timings: dict) -> dict:
+    """The result of a successful provider call; `usage` is left out if None."""
+    result = {"success": True, "response": text, "model": model}
+    if usage is not None:
+        result["usage"] = usage
+    result["elapsed_seconds"] = round(timings["request_seconds"], 2)
+    result["timings"] = timings
+    return result
 
 
 async def call_openai(prompt: str, config: dict) -> dict:
     """Call OpenAI API."""
     try:
-        from openai import AsyncOpenAI
-        
-        client = AsyncOpenAI(api_key=config["api_key"])
-        start_time = time.time()
+        client = get_client("openai", config)
+        timing = _start_timing()
         
         response = await client.chat.completions.create(
             model=config.get("model", "gpt-5.2"),
@@ -31,29 +466,21 @@ async def call_openai(prompt: str, config: dict) -> dict:
             max_completion_tokens=config.get("max_tokens", 1024),
         )
         
-        elapsed = time.time() - start_time
-        return {
-            "success": True,
-            "response": response.choices[0].message.content,
-            "model": response.model,
-            "usage": {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens,
-            },
-            "elapsed_seconds": round(elapsed, 2),
-        }
+        return _success_result(
+            response.choices[0].message.content,
+            response.model,
+            _pick(response.usage, OPENAI_USAGE_FIELDS),
+            _request_timings(timing),
+        )
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        return error_result(e)
 
 
 async def call_anthropic(prompt: str, config: dict) -> dict:
     """Call Anthropic API."""
     try:
-        from anthropic import AsyncAnthropic
-        
-        client = AsyncAnthropic(api_key=config["api_key"])
-        start_time = time.time()
+        client = get_client("anthropic", config)
+        timing = _start_timing()
         
         response = await client.messages.create(
             model=config.get("model", "claude-3-5-sonnet-20241022"),
@@ -61,48 +488,289 @@ async def call_anthropic(prompt: str, config: dict) -> dict:
             messages=[{"role": "user", "content": prompt}],
         )
         
-        elapsed = time.time() - start_time
-        return {
-            "success": True,
-            "response": response.content[0].text,
-            "model": response.model,
-            "usage": {
-                "input_tokens": response.usage.input_tokens,
-                "output_tokens": response.usage.output_tokens,
-            },
-            "elapsed_seconds": round(elapsed, 2),
-        }
+        return _success_result(
+            _anthropic_text(response.content),
+            response.model,
+            _pick(response.usage, ANTHROPIC_USAGE_FIELDS),
+            _request_timings(timing),
+        )
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        return error_result(e)
+
+
+def _gemini_text(data: dict) -> str:
+    """Extract the response text from a Gemini response body."""
+    candidates = data.get("candidates") or []
+    if not candidates:
+        reason = data.get("promptFeedback", {}).get("blockReason", "no candidates returned")
+        raise ValueError(f"Gemini returned no response: {reason}")
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+def _gemini_usage(data: dict) -> dict:
+    """Extract token usage from a Gemini response body."""
+    usage = data.get("usageMetadata", {})
+    return {
+        "prompt_token_count": usage.get("promptTokenCount", 0),
+        "candidates_token_count": usage.get("candidatesTokenCount", 0),
+        "total_token_count": usage.get("totalTokenCount", 0),
+    }
 
 
 async def call_google(prompt: str, config: dict) -> dict:
     """Call Google Gemini API."""
     try:
-        import google.generativeai as genai
+        client = get_client("google", config)
+        model = config.get("model", "gemini-pro")
+        timing = _start_timing()
+        
+        data = await client.generate_content(
+            model,
+            prompt,
+            generation_config={
+                "temperature": config.get("temperature", 0.7),
+                "maxOutputTokens": config.get("max_tokens", 1024),
+            },
+        )
+        
+        return _success_result(
+            _gemini_text(data), data.get("modelVersion", model), _gemini_usage(data), _request_timings(timing)
+        )
+    except Exception as e:
+        return error_result(e)
+
+
+# Raw-HTTP variants of the SDK-based providers, used with `client = "http"`.
+# They return the same results without importing the SDKs.
+
+
+async def call_openai_http(prompt: str, config: dict) -> dict:
+    """Call OpenAI API over plain HTTP."""
+    try:
+        client = get_client("openai_http", config)
+        timing = _start_timing()
+        
+        data = await client.post("/chat/completions", {
+            "model": config.get("model", "gpt-5.2"),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": config.get("temperature", 0.7),
+            "max_completion_tokens": config.get("max_tokens", 1024),
+        })
+        
+        return _success_result(
+            data["choices"][0]["message"]["content"],
+            data["model"],
+            _pick(data.get("usage", {}), OPENAI_USAGE_FIELDS),
+            _request_timings(timing),
+        )
+    except Exception as e:
+        return error_result(e)
+
+
+async def call_anthropic_http(prompt: str, config: dict) -> dict:
+    """Call Anthropic API over plain HTTP."""
+    try:
+        client = get_client("anthropic_http", config)
+        timing = _start_timing()
+        
+        data = await client.post("/v1/messages", {
+            "model": config.get("model", "claude-3-5-sonnet-20241022"),
+            "max_tokens": config.get("max_tokens", 1024),
+            "messages": [{"role": "user", "content": prompt}],
+        })
+        
+        return _success_result(
+            _anthropic_text(data["content"]),
+            data["model"],
+            _pick(data.get("usage", {}), ANTHROPIC_USAGE_FIELDS),
+            _request_timings(timing),
+        )
+    except Exception as e:
+        return error_result(e)
+
+
+# Streaming variants of the provider calls. Each yields events of the form
+# {"type": "delta", "text": ...} while the response is generated, followed by
+# exactly one {"type": "result", "result": ...} carrying the same dict the
+# matching call_<provider> function would have returned.
+
+async def stream_openai(prompt: str, config: dict) -> AsyncIterator[dict]:
+    """Stream OpenAI API output."""
+    try:
+        client = get_client("openai", config)
+        timing = _start_timing()
+        
+        stream = await client.chat.completions.create(
+            model=config.get("model", "gpt-5.2"),
+            messages=[{"role": "user", "content": prompt}],
+            temperature=config.get("temperature", 0.7),
+            max_completion_tokens=config.get("max_tokens", 1024),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        
+        chunks = []
+        model = config.get("model", "gpt-5.2")
+        usage = None
+        first_token = None
+        async for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                text = chunk.choices[0].delta.content
+                first_token = first_token or time.monotonic()
+                chunks.append(text)
+                yield {"type": "delta", "text": text}
+        
+        result = _success_result(
+            "".join(chunks),
+            model,
+            _pick(usage, OPENAI_USAGE_FIELDS) if usage else None,
+            _request_timings(timing, first_token),
+        )
+    except Exception as e:
+        result = error_result(e)
+    yield {"type": "result", "result": result}
+
+
+async def stream_anthropic(prompt: str, config: dict) -> AsyncIterator[dict]:
+    """Stream Anthropic API output."""
+    try:
+        client = get_client("anthropic", config)
+        timing = _start_timing()
+        
+        async with client.messages.stream(
+            model=config.get("model", "claude-3-5-sonnet-20241022"),
+            max_tokens=config.get("max_tokens", 1024),
+            messages=[{"role": "user", "content": prompt}],
+        ) as stream:
+            first_token = None
+            async for text in stream.text_stream:
+                first_token = first_token or time.monotonic()
+                yield {"type": "delta", "text": text}
+            response = await stream.get_final_message()
         
-        genai.configure(api_key=config["api_key"])
-        model = genai.GenerativeModel(config.get("model", "gemini-pro"))
+        result = _success_result(
+            _anthropic_text(response.content),
+            response.model,
+            _pick(response.usage, ANTHROPIC_USAGE_FIELDS),
+            _request_timings(timing, first_token),
+        )
+    except Exception as e:
+        result = error_result(e)
+    yield {"type": "result", "result": result}
+
+
+async def stream_google(prompt: str, config: dict) -> AsyncIterator[dict]:
+    """Stream Google Gemini API output."""
+    try:
+        client = get_client("google", config)
+        model = config.get("model", "gemini-pro")
+        timing = _start_timing()
         
-        start_time = time.time()
-        response = await asyncio.to_thread(
-            model.generate_content,
+        chunks = []
+        last = {}
+        first_token = None
+        async for data in client.stream_generate_content(
+            model,
             prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=config.get("temperature", 0.7),
-                max_output_tokens=config.get("max_tokens", 1024),
-            ),
+            generation_config={
+                "temperature": config.get("temperature", 0.7),
+                "maxOutputTokens": config.get("max_tokens", 1024),
+            },
+        ):
+            last = data
+            text = _gemini_text(data)
+            if text:
+                first_token = first_token or time.monotonic()
+                chunks.append(text)
+                yield {"type": "delta", "text": text}
+        
+        result = _success_result(
+            "".join(chunks), last.get("modelVersion", model), _gemini_usage(last), _request_timings(timing, first_token)
+        )
+    except Exception as e:
+        result = error_result(e)
+    yield {"type": "result", "result": result}
+
+
+async def stream_openai_http(prompt: str, config: dict) -> AsyncIterator[dict]:
+    """Stream OpenAI API output over plain HTTP."""
+    try:
+        client = get_client("openai_http", config)
+        timing = _start_timing()
+        
+        chunks = []
+        model = config.get("model", "gpt-5.2")
+        usage = None
+        first_token = None
+        async for chunk in client.stream("/chat/completions", {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": config.get("temperature", 0.7),
+            "max_completion_tokens": config.get("max_tokens", 1024),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }):
+            model = chunk.get("model") or model
+            usage = chunk.get("usage") or usage
+            choices = chunk.get("choices")
+            text = choices[0].get("delta", {}).get("content") if choices else None
+            if text:
+                first_token = first_token or time.monotonic()
+                chunks.append(text)
+                yield {"type": "delta", "text": text}
+        
+        result = _success_result(
+            "".join(chunks),
+            model,
+            _pick(usage, OPENAI_USAGE_FIELDS) if usage else None,
+            _request_timings(timing, first_token),
         )
+    except Exception as e:
+        result = error_result(e)
+    yield {"type": "result", "result": result}
+
+
+async def stream_anthropic_http(prompt: str, config: dict) -> AsyncIterator[dict]:
+    """Stream Anthropic API output over plain HTTP."""
+    try:
+        client = get_client("anthropic_http", config)
+        timing = _start_timing()
         
-        elapsed = time.time() - start_time
-        return {
-            "success": True,
-            "response": response.text,
-            "model": config.get("model", "gemini-pro"),
-            "elapsed_seconds": round(elapsed, 2),
-        }
+        chunks = []
+        model = config.get("model", "claude-3-5-sonnet-20241022")
+        usage = {}
+        first_token = None
+        async for event in client.stream("/v1/messages", {
+            "model": model,
+            "max_tokens": config.get("max_tokens", 1024),
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+        }):
+            if event["type"] == "message_start":
+                model = event["message"].get("model", model)
+                usage.update(event["message"].get("usage", {}))
+            elif event["type"] == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                first_token = first_token or time.monotonic()
+                chunks.append(event["delta"]["text"])
+                yield {"type": "delta", "text": event["delta"]["text"]}
+            elif event["type"] == "message_delta":
+                usage.update(event.get("usage", {}))
+            elif event["type"] == "error":
+                raise RuntimeError(event["error"].get("message", "Stream error"))
+        
+        result = _success_result(
+            "".join(chunks),
+            model,
+            _pick(usage, ANTHROPIC_USAGE_FIELDS),
+            _request_timings(timing, first_token),
+        )
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        result = error_result(e)
+    yield {"type": "result", "result": result}
 
 
 # Provider registry
@@ -112,12 +780,296 @@ PROVIDERS = {
     "google": call_google,
 }
 
+STREAMERS = {
+    "openai": stream_openai,
+    "anthropic": stream_anthropic,
+    "google": stream_google,
+}
+
+# Providers' raw-HTTP implementations, picked with `client = "http"`.
+# Google only has one, which already talks HTTP directly.
+HTTP_PROVIDERS = {
+    "openai": call_openai_http,
+    "anthropic": call_anthropic_http,
+}
 
-async def run_test(prompt: str, config: dict) -> dict:
-    """Run the prompt against all enabled providers."""
-    results = {}
-    tasks = []
-    provider_names = []
+HTTP_STREAMERS = {
+    "openai": stream_openai_http,
+    "anthropic": stream_anthropic_http,
+}
+
+# SDK modules imported by the SDK-based clients
+PROVIDER_SDKS = {
+    "openai": "openai",
+    "anthropic": "anthropic",
+}
+
+
+def uses_sdk(provider: str, config: dict) -> bool:
+    """Whether calls to a provider go through its SDK rather than raw HTTP."""
+    return provider in PROVIDER_SDKS and config.get("client", "sdk") != "http"
+
+
+def provider_function(provider: str, config: dict):
+    """The call_<provider> function for a provider's configured client."""
+    if uses_sdk(provider, config):
+        return PROVIDERS[provider]
+    return HTTP_PROVIDERS.get(provider, PROVIDERS[provider])
+
+
+def provider_streamer(provider: str, config: dict):
+    """The stream_<provider> function for a provider's configured client."""
+    if uses_sdk(provider, config):
+        return STREAMERS[provider]
+    return HTTP_STREAMERS.get(provider, STREAMERS[provider])
+
+
+DEFAULT_CACHE_PATH = "cache/responses.db"
+
+# Open response caches, keyed by database path
+_caches: dict[str, ResponseCache] = {}
+
+
+def open_cache(config: dict, mode: str) -> ResponseCache | None:
+    """Return the response cache configured in `[cache]`, used as `mode` says.
+    
+    Returns None when mode is "off". The underlying store is opened once per
+    path and shared.
+    """
+    if mode == "off":
+        return None
+    
+    cache_config = config.get("cache", {})
+    path = cache_config.get("path", DEFAULT_CACHE_PATH)
+    if path not in _caches:
+        _caches[path] = ResponseCache(
+            Path(path),
+            max_size_mb=cache_config.get("max_size_mb", 256),
+            max_age_days=cache_config.get("max_age_days", 30),
+        )
+    return _caches[path].with_mode(mode)
+
+
+# Rate limiters keyed by (provider, api_key, model, rpm, tpm). They are shared
+# by every call in the process, whichever thread or event loop makes it.
+_limiters: dict[tuple, RateLimiter] = {}
+
+
+def get_rate_limiter(provider: str, config: dict) -> RateLimiter | None:
+    """Return the limiter for a provider model, or None if it has no limits.
+    
+    Limits come from `requests_per_minute` and `tokens_per_minute` in the
+    provider's config section.
+    """
+    rpm = config.get("requests_per_minute")
+    tpm = config.get("tokens_per_minute")
+    if not rpm and not tpm:
+        return None
+    
+    key = (provider, config.get("api_key"), config.get("model"), rpm, tpm)
+    if key not in _limiters:
+        _limiters[key] = RateLimiter(rpm, tpm)
+    return _limiters[key]
+
+
+# Latency trackers and hedging budgets keyed by (provider, model, max rate)
+_hedgers: dict[tuple, Hedger] = {}
+
+
+def get_hedger(provider: str, config: dict) -> Hedger:
+    """Return the latency tracker / hedger for a provider model."""
+    max_rate = config.get("hedge_max_rate", 0.1)
+    key = (provider, config.get("model"), max_rate)
+    if key not in _hedgers:
+        _hedgers[key] = Hedger(max_rate=max_rate)
+    return _hedgers[key]
+
+
+async def call_provider(
+    provider: str, prompt: str, config: dict, cache: ResponseCache | None = None
+) -> dict:
+    """Call a provider, going through the response cache when one is given.
+    
+    Calls that miss the cache wait on the provider's rate limiter, and
+    transient failures are retried with backoff as set by its RetryPolicy.
+    The result records how many attempts were made. With `hedge` enabled
+    for the provider, attempts slower than its observed p90 latency are
+    duplicated and the first answer wins.
+    
+    `timings` in the result break the call down into time spent waiting on
+    the rate limiter, the last request's time to first byte and duration,
+    the total including retries, and output tokens per second.
+    """
+    start = time.monotonic()
+    span = tracing.start_span("provider.call", provider=provider, model=config.get("model"))
+    key = cache_key(provider, prompt, config) if cache else None
+    if cache and cache.read:
+        cached = cache.get(key)
+        metrics.cache_lookups.inc("miss" if cached is None else "hit")
+        if cached is not None:
+            result = {**cached, "cached": True, "timings": {"total_seconds": round(time.monotonic() - start, 4)}}
+            _record_call(provider, config, result, span)
+            return result
+    
+    policy = RetryPolicy.from_config(config)
+    limiter = get_rate_limiter(provider, config)
+    hedger = get_hedger(provider, config)
+    deadline = None
+    attempt = 0
+    queue_wait = 0.0
+    
+    while True:
+        attempt += 1
+        if limiter:
+            estimated = estimate_tokens(prompt, config)
+            queue_wait += await _acquire(limiter, estimated)
+        # Time queued for the first request doesn't count against the deadline
+        deadline = deadline or time.monotonic() + policy.deadline
+        
+        result = await hedger.call(
+            lambda: provider_function(provider, config)(prompt, config),
+            hedge=config.get("hedge", False),
+            # A hedge is a second request: send it only if the limits allow it now
+            has_capacity=(lambda: limiter.try_acquire(estimated)) if limiter else None,
+        )
+        
+        if limiter:
+            limiter.settle(estimated, used_tokens(result))
+        
+        delay = _retry_delay(policy, result, attempt, deadline)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+    
+    result["attempts"] = attempt
+    result["timings"] = _call_timings(result, start, queue_wait)
+    _record_call(provider, config, result, span)
+    if cache and cache.write and result.get("success"):
+        cache.put(key, result)
+    return result
+
+
+def _record_call(provider: str, config: dict, result: dict, span):
+    """Record a finished provider call in the metrics and end its span."""
+    metrics.record_call(provider, config, result)
+    if span is tracing.NOOP_SPAN:
+        return
+    input_tokens, output_tokens = token_counts(result.get("usage"))
+    span.set_attributes(
+        model=result.get("model") or config.get("model"),
+        success=bool(result.get("success")),
+        cached=bool(result.get("cached")),
+        attempts=result.get("attempts", 0),
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        ttft_seconds=result.get("timings", {}).get("ttft_seconds"),
+    )
+    if not result.get("success"):
+        span.set_error(str(result.get("error", "")))
+    span.end()
+
+
+async def _acquire(limiter: RateLimiter, tokens: int) -> float:
+    """Wait for the rate limiter. Returns the seconds spent waiting."""
+    waited = time.monotonic()
+    await limiter.acquire(tokens)
+    return time.monotonic() - waited
+
+
+def _call_timings(result: dict, start: float, queue_wait: float) -> dict:
+    """Combine a result's request timings with the call's queueing and total time."""
+    timings = {
+        "queue_wait_seconds": round(queue_wait, 4),
+        **result.get("timings", {}),
+        "total_seconds": round(time.monotonic() - start, 4),
+    }
+    _, output_tokens = token_counts(result.get("usage"))
+    request = timings.get("request_seconds")
+    if output_tokens and request:
+        # Generation starts with the first token when streaming
+        generation = request - timings.get("ttft_seconds", 0)
+        if generation > 0:
+            timings["output_tokens_per_second"] = round(output_tokens / generation, 1)
+    return timings
+
+
+def _retry_delay(policy: RetryPolicy, result: dict, attempt: int, deadline: float) -> float | None:
+    """Seconds to wait before retrying a result, or None if it should not be retried.
+    
+    The deadline only decides whether to retry; a request in flight is never
+    cut short, so long generations run to the client's own timeout.
+    """
+    if result.get("success") or not result.get("retryable") or attempt > policy.max_retries:
+        return None
+    delay = policy.delay(attempt, result.get("retry_after"))
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+async def stream_provider(
+    provider: str, prompt: str, config: dict, cache: ResponseCache | None = None
+) -> AsyncIterator[dict]:
+    """Stream a provider's output, going through the response cache when one is given.
+    
+    Rate limiting and retries work as in call_provider(), except that a
+    stream is only retried if it failed before producing any output. The
+    result's `timings` also include the time to first token.
+    """
+    start = time.monotonic()
+    span = tracing.start_span("provider.call", provider=provider, model=config.get("model"))
+    key = cache_key(provider, prompt, config) if cache else None
+    if cache and cache.read:
+        cached = cache.get(key)
+        metrics.cache_lookups.inc("miss" if cached is None else "hit")
+        if cached is not None:
+            result = {**cached, "cached": True, "timings": {"total_seconds": round(time.monotonic() - start, 4)}}
+            _record_call(provider, config, result, span)
+            yield {"type": "delta", "text": cached["response"]}
+            yield {"type": "result", "result": result}
+            return
+    
+    policy = RetryPolicy.from_config(config)
+    limiter = get_rate_limiter(provider, config)
+    deadline = None
+    attempt = 0
+    queue_wait = 0.0
+    
+    while True:
+        attempt += 1
+        if limiter:
+            estimated = estimate_tokens(prompt, config)
+            queue_wait += await _acquire(limiter, estimated)
+        deadline = deadline or time.monotonic() + policy.deadline
+        
+        streamed = False
+        async for event in provider_streamer(provider, config)(prompt, config):
+            if event["type"] == "result":
+                result = event["result"]
+                continue
+            streamed = True
+            yield event
+        
+        if limiter:
+            limiter.settle(estimated, used_tokens(result))
+        
+        delay = None if streamed else _retry_delay(policy, result, attempt, deadline)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+    
+    result["attempts"] = attempt
+    result["timings"] = _call_timings(result, start, queue_wait)
+    _record_call(provider, config, result, span)
+    if cache and cache.write and result.get("success"):
+        cache.put(key, result)
+    yield {"type": "result", "result": result}
+
+
+def select_providers(config: dict) -> tuple[dict, dict]:
+    """Split enabled providers into runnable configs and immediate failures."""
+    runnable = {}
+    failures = {}
     
     providers_config = config.get("providers", {})
     
@@ -126,21 +1078,29 @@ async def run_test(prompt: str, config: dict) -> dict:
             continue
         
         if provider_name not in PROVIDERS:
-            results[provider_name] = {
+            failures[provider_name] = {
                 "success": False,
                 "error": f"Unknown provider: {provider_name}",
             }
             continue
         
         if not provider_config.get("api_key"):
-            results[provider_name] = {
+            failures[provider_name] = {
                 "success": False,
                 "error": "API key not configured",
             }
             continue
         
-        provider_names.append(provider_name)
-        tasks.append(PROVIDERS[provider_name](prompt, provider_config))
+        runnable[provider_name] = provider_config
+    
+    return runnable, failures
+
+
+async def run_test(prompt: str, config: dict, cache: ResponseCache | None = None) -> dict:
+    """Run the prompt against all enabled providers."""
+    runnable, results = select_providers(config)
+    provider_names = list(runnable)
+    tasks = [call_provider(name, prompt, runnable[name], cache) for name in provider_names]
     
     if tasks:
         responses = await asyncio.gather(*tasks, return_exceptions=True)
@@ -153,13 +1113,128 @@ async def run_test(prompt: str, config: dict) -> dict:
     return results
 
 
-def load_config(config_path: Path) -> dict:
-    """Load configuration from TOML file."""
-    if not config_path.exists():
+async def run_variants(
+    prompts: dict[str, str], config: dict, cache: ResponseCache | None = None
+) -> dict[str, dict]:
+    """Run several prompt variants against all enabled providers at once.
+    
+    Every variant x provider call shares one gather, so the total time is
+    that of the slowest call. Empty prompts are skipped and get no results.
+    """
+    names = [name for name, prompt in prompts.items() if prompt]
+    responses = await asyncio.gather(*(run_test(prompts[name], config, cache) for name in names))
+    results = {name: {} for name in prompts}
+    results.update(zip(names, responses))
+    return results
+
+
+async def iter_variants(
+    prompts: dict[str, str], config: dict, cache: ResponseCache | None = None
+) -> AsyncIterator[tuple[str, str, dict]]:
+    """Run prompt variants like run_variants(), yielding each result as it lands.
+    
+    Yields (variant, provider, result). Closing the iterator early cancels
+    the calls still in flight.
+    """
+    runnable, failures = select_providers(config)
+    tasks = {}
+    
+    for variant, prompt in prompts.items():
+        if not prompt:
+            continue
+        for name, result in failures.items():
+            yield variant, name, result
+        for name, provider_config in runnable.items():
+            task = asyncio.ensure_future(call_provider(name, prompt, provider_config, cache))
+            tasks[task] = (variant, name)
+    
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                variant, name = tasks[task]
+                try:
+                    result = task.result()
+                except Exception as e:
+                    result = error_result(e)
+                yield variant, name, result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def merge_streams(streams: dict) -> AsyncIterator[tuple[Any, Any]]:
+    """Interleave several async iterators, yielding (key, item) as items arrive."""
+    queue = asyncio.Queue()
+    done = object()
+    
+    async def pump(key, stream):
+        try:
+            async for item in stream:
+                await queue.put((key, item))
+        finally:
+            await queue.put((key, done))
+    
+    tasks = [asyncio.create_task(pump(key, stream)) for key, stream in streams.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            key, item = await queue.get()
+            if item is done:
+                remaining -= 1
+                continue
+            yield key, item
+        # Surface errors raised inside a stream
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def stream_test(
+    prompt: str, config: dict, cache: ResponseCache | None = None
+) -> AsyncIterator[tuple[str, dict]]:
+    """Stream the prompt to all enabled providers.
+    
+    Yields (provider, event) pairs as output arrives; every provider ends
+    with a "result" event, including ones that could not be run.
+    """
+    runnable, failures = select_providers(config)
+    
+    for name, result in failures.items():
+        yield name, {"type": "result", "result": result}
+    
+    streams = {name: stream_provider(name, prompt, cfg, cache) for name, cfg in runnable.items()}
+    async for name, event in merge_streams(streams):
+        yield name, event
+
+
+def load_config(config_path: Path) -> Mapping:
+    """Load configuration from TOML file as a validated, read-only mapping."""
+    try:
+        snapshot = get_config_manager(config_path).snapshot()
+    except ConfigError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    if not snapshot.exists:
         print(f"Error: Config file not found: {config_path}", file=sys.stderr)
         sys.exit(1)
     
-    return toml.load(config_path)
+    tracing.configure(snapshot.data.get("tracing", {}))
+    return snapshot.data
+
+
+def combine_prompt(prompt: str, shared: str) -> str:
+    """Combine a prompt with a shared input (e.g. a customer query)."""
+    if not prompt:
+        return ""
+    if not shared:
+        return prompt
+    return f"{prompt}\n\n---\n\n{shared}"
 
 
 def load_prompt(prompt_path: Path) -> str:
@@ -191,8 +1266,12 @@ def format_text_output(results: dict, prompt: str) -> str:
         if result.get("success"):
             if result.get("model"):
                 lines.append(f"Model: {result['model']}")
+            if result.get("cached"):
+                lines.append("Cached: yes")
             if result.get("elapsed_seconds"):
                 lines.append(f"Time: {result['elapsed_seconds']}s")
+            if result.get("timings"):
+                lines.append(f"Timings: {format_timings(result['timings'])}")
             if result.get("usage"):
                 usage = result["usage"]
                 usage_str = ", ".join(f"{k}: {v}" for k, v in usage.items())
@@ -208,9 +1287,363 @@ def format_text_output(results: dict, prompt: str) -> str:
     return "\n".join(lines)
 
 
+# Labels for the timings shown in text output
+TIMING_LABELS = {
+    "queue_wait_seconds": "queued",
+    "ttfb_seconds": "first byte",
+    "ttft_seconds": "first token",
+    "request_seconds": "request",
+    "total_seconds": "total",
+}
+
+
+def format_timings(timings: dict) -> str:
+    """Format a result's timings breakdown on one line."""
+    parts = [f"{label} {timings[key]:.3f}s" for key, label in TIMING_LABELS.items() if key in timings]
+    if "output_tokens_per_second" in timings:
+        parts.append(f"{timings['output_tokens_per_second']} tokens/s")
+    return ", ".join(parts)
+
+
+def format_result_summary(result: dict) -> str:
+    """Format a one-line summary of a provider result."""
+    if not result.get("success"):
+        return f"ERROR: {result.get('error', 'Unknown error')}"
+    parts = []
+    if result.get("model"):
+        parts.append(f"Model: {result['model']}")
+    if result.get("cached"):
+        parts.append("Cached")
+    if result.get("elapsed_seconds"):
+        parts.append(f"Time: {result['elapsed_seconds']}s")
+    if result.get("timings"):
+        parts.append(f"Timings: {format_timings(result['timings'])}")
+    if result.get("usage"):
+        parts.append("Usage: " + ", ".join(f"{k}: {v}" for k, v in result["usage"].items()))
+    return " | ".join(parts) or "done"
+
+
+async def print_stream(
+    prompt: str, config: dict, output: str, cache: ResponseCache | None = None
+) -> dict:
+    """Print provider output as it streams in and return the final results.
+    
+    Text output is interleaved line by line, each line prefixed with its
+    provider. JSON output is one event object per line.
+    """
+    printer = StreamPrinter(output)
+    async for provider, event in stream_test(prompt, config, cache):
+        printer.print(provider, event)
+    return printer.results
+
+
+class StreamPrinter:
+    """Prints stream events as they arrive and collects the final results.
+    
+    Text output writes deltas as soon as they arrive, without waiting for a
+    full line. Each line is prefixed with its provider; when providers take
+    turns mid-line, the open line is ended and continued under a new prefix.
+    """
+    
+    def __init__(self, output: str):
+        self.output = output
+        self.results = {}
+        # Provider whose line is open (written without its newline yet)
+        self._open = None
+    
+    def print(self, provider: str, event: dict):
+        if self.output == "json":
+            print(json.dumps({"provider": provider, **event}), flush=True)
+        elif event["type"] == "delta":
+            self._write(provider, event["text"])
+        else:
+            self._end_line()
+            print(f"[{provider}] {format_result_summary(event['result'])}", flush=True)
+        
+        if event["type"] == "result":
+            self.results[provider] = event["result"]
+    
+    def _write(self, provider: str, text: str):
+        for i, segment in enumerate(text.split("\n")):
+            if i:
+                sys.stdout.write("\n")
+                self._open = None
+            if not segment:
+                continue
+            if self._open != provider:
+                self._end_line()
+                sys.stdout.write(f"[{provider}] ")
+                self._open = provider
+            sys.stdout.write(segment)
+        sys.stdout.flush()
+    
+    def _end_line(self):
+        if self._open is not None:
+            sys.stdout.write("\n")
+            self._open = None
+
+
+class MalformedRow(dict):
+    """A dataset line that could not be parsed, carried as an empty row."""
+    
+    def __init__(self, error: str):
+        super().__init__()
+        self.error = error
+
+
+def read_dataset(dataset_path: Path, input_field: str = "input") -> Iterator[dict]:
+    """Stream rows from a JSONL or CSV dataset, one dict per row.
+    
+    JSONL lines that are not objects (e.g. bare strings) are wrapped as
+    {input_field: value}, and lines that are not valid JSON become a
+    MalformedRow. The file is read incrementally, never all at once.
+    """
+    with open(dataset_path, newline="") as f:
+        if dataset_path.suffix.lower() == ".csv":
+            yield from csv.DictReader(f)
+            return
+        
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield MalformedRow(f"Line {number} is not valid JSON: {e.msg} (column {e.colno})")
+                continue
+            yield row if isinstance(row, dict) else {input_field: row}
+
+
+def expand_batch(
+    prompts: dict[str, str], rows: Iterable[dict], config: dict, input_field: str = "input"
+) -> Iterator[tuple[dict, str | None, dict | None]]:
+    """Lazily expand dataset rows x prompts x providers into batch jobs.
+    
+    Yields (record, full_prompt, provider_config). Jobs that cannot be run
+    (unknown provider, missing key, malformed row, row without input) have
+    their failure already set as record["result"] and no provider_config.
+    """
+    runnable, failures = select_providers(config)
+    
+    for index, row in enumerate(rows):
+        shared_input = row.get(input_field)
+        for prompt_name, prompt in prompts.items():
+            base = {"prompt": prompt_name, "row": index, "input": shared_input}
+            
+            if isinstance(row, MalformedRow):
+                error = {"success": False, "error": row.error}
+                yield {**base, "provider": None, "result": error}, None, None
+                continue
+            if shared_input is None:
+                error = {"success": False, "error": f"Row has no '{input_field}' field"}
+                yield {**base, "provider": None, "result": error}, None, None
+                continue
+            
+            full_prompt = combine_prompt(prompt, str(shared_input))
+            for provider, result in failures.items():
+                yield {**base, "provider": provider, "result": result}, None, None
+            for provider, provider_config in runnable.items():
+                yield {**base, "provider": provider}, full_prompt, provider_config
+
+
+async def run_batch(
+    jobs: Iterator[tuple], out, concurrency: int, cache: ResponseCache | None = None
+) -> dict:
+    """Execute batch jobs with at most `concurrency` provider calls in flight.
+    
+    Records are written to `out` as JSON Lines in completion order. Jobs are
+    pulled from the iterator on demand, so memory stays flat however large
+    the dataset is. Returns a summary of the run.
+    """
+    summary = {"calls": 0, "failed": 0}
+    
+    async def worker():
+        for record, full_prompt, provider_config in jobs:
+            if provider_config is not None:
+                record["result"] = await call_provider(
+                    record["provider"], full_prompt, provider_config, cache
+                )
+            
+            summary["calls"] += 1
+            if not record["result"].get("success"):
+                summary["failed"] += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    
+    start_time = time.time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary["elapsed_seconds"] = round(time.time() - start_time, 2)
+    return summary
+
+
+def run_on_daemon(args: argparse.Namespace, prompt: str):
+    """Run the prompt on a `promptchad serve` daemon and print its output.
+    
+    Raises DaemonUnavailable if no daemon can take the run.
+    """
+    messages = forward(args.socket, {
+        "prompt": prompt,
+        "config": str(args.config.resolve()),
+        "cache": args.cache,
+        "stream": args.stream,
+    })
+    printer = StreamPrinter(args.output)
+    for message in messages:
+        if message["type"] == "error":
+            print(f"Error: {message['error']}", file=sys.stderr)
+            sys.exit(1)
+        elif message["type"] == "results":
+            if args.output == "json":
+                print(json.dumps({"prompt": prompt, "results": message["results"]}, indent=2))
+            else:
+                print(format_text_output(message["results"], prompt))
+        elif message["type"] != "done":
+            printer.print(message.pop("provider"), message)
+
+
+class RunTimer:
+    """Wall-clock time of each phase of a CLI run, reported by `--timing`."""
+    
+    def __init__(self):
+        # CPU time used before main(): interpreter startup and module imports
+        self.startup_seconds = time.process_time()
+        self.start = self._last = time.perf_counter()
+        self.phases: dict[str, float] = {}
+    
+    def mark(self, phase: str):
+        """End a phase that started when the previous one ended."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+    
+    def report(self) -> str:
+        lines = ["Timing:", f"  {'startup + imports (CPU)':<26}{self.startup_seconds * 1000:9.1f} ms"]
+        for phase, seconds in self.phases.items():
+            lines.append(f"  {phase:<26}{seconds * 1000:9.1f} ms")
+        for sdk, seconds in sdk_import_seconds.items():
+            lines.append(f"  {'import ' + sdk:<26}{seconds * 1000:9.1f} ms (in the background)")
+        lines.append(f"  {'total since main()':<26}{(time.perf_counter() - self.start) * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+
+def add_diagnostic_arguments(parser: argparse.ArgumentParser):
+    """Add the `--timing` and `--profile` options shared by the CLI commands."""
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="Print how long startup, imports and each phase of the run took",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILE_MODES,
+        help="Profile the run: cpu (cProfile), async (slow event loop callbacks) or memory (tracemalloc)",
+    )
+    parser.add_argument(
+        "--profile-out",
+        type=Path,
+        help="Where to save the profile (default: profile-<mode>-<time> in the current directory)",
+    )
+
+
+def batch_main(argv: list[str]):
+    """Entry point for `promptchad batch`."""
+    timer = RunTimer()
+    parser = argparse.ArgumentParser(
+        prog="promptchad batch",
+        description="Run prompt templates against every input in a dataset",
+    )
+    parser.add_argument(
+        "prompt_files",
+        type=Path,
+        nargs="+",
+        help="Paths to the prompt files",
+    )
+    parser.add_argument(
+        "--dataset",
+        "-d",
+        type=Path,
+        required=True,
+        help="JSONL or CSV file of shared inputs",
+    )
+    parser.add_argument(
+        "--input-field",
+        "-f",
+        default="input",
+        help="Field (or CSV column) holding the shared input (default: input)",
+    )
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=Path,
+        default=Path("config.toml"),
+        help="Path to config file (default: config.toml)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        "-j",
+        type=int,
+        default=16,
+        help="Maximum provider calls in flight (default: 16)",
+    )
+    parser.add_argument(
+        "--out",
+        "-o",
+        type=Path,
+        help="Write JSON Lines results to this file (default: stdout)",
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default="off",
+        help="Response cache mode (default: off)",
+    )
+    add_diagnostic_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    
+    config = load_config(args.config)
+    prefetch_sdks(config)
+    timer.mark("config")
+    prompts = {str(path): load_prompt(path) for path in args.prompt_files}
+    
+    if not args.dataset.exists():
+        print(f"Error: Dataset file not found: {args.dataset}", file=sys.stderr)
+        sys.exit(1)
+    
+    jobs = expand_batch(prompts, read_dataset(args.dataset, args.input_field), config, args.input_field)
+    
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        cache = open_cache(config, args.cache)
+        with profile(args.profile, args.profile_out), tracing.span("cli.batch", concurrency=args.concurrency):
+            summary = run_async(run_batch(jobs, out, max(1, args.concurrency), cache))
+        timer.mark("run")
+    finally:
+        if args.out:
+            out.close()
+    
+    print(
+        f"Completed {summary['calls']} calls ({summary['failed']} failed) "
+        f"in {summary['elapsed_seconds']}s",
+        file=sys.stderr,
+    )
+    if args.timing:
+        print(timer.report(), file=sys.stderr)
+
+
 def main():
+    timer = RunTimer()
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
-        description="Test prompts across multiple AI providers"
+        description="Test prompts across multiple AI providers",
+        epilog="Run `promptchad batch --help` to test prompts against a dataset, "
+        "or `promptchad serve --help` to keep a warm process for the CLI to use.",
     )
     parser.add_argument(
         "prompt_file",
@@ -237,26 +1670,76 @@ def main():
         type=str,
         help="Use this text as prompt instead of reading from file",
     )
+    parser.add_argument(
+        "--stream",
+        "-s",
+        action="store_true",
+        help="Print responses as they are generated",
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default="off",
+        help="Response cache mode (default: off)",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Socket of a `promptchad serve` daemon to run on if it is running (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always run in this process, even if a daemon is running",
+    )
+    add_diagnostic_arguments(parser)
     
     args = parser.parse_args()
     
-    config = load_config(args.config)
-    
     if args.prompt_text:
         prompt = args.prompt_text
     else:
         prompt = load_prompt(args.prompt_file)
     
-    results = asyncio.run(run_test(prompt, config))
+    # Profiles are of this process, so those runs stay here
+    if not args.no_daemon and not args.profile:
+        try:
+            run_on_daemon(args, prompt)
+            timer.mark("run (daemon)")
+            if args.timing:
+                print(timer.report(), file=sys.stderr)
+            return
+        except DaemonUnavailable:
+            pass
+    
+    config = load_config(args.config)
+    prefetch_sdks(config)
+    timer.mark("config")
+    
+    cache = open_cache(config, args.cache)
+    timer.mark("cache")
     
-    if args.output == "json":
-        output = {
-            "prompt": prompt,
-            "results": results,
-        }
-        print(json.dumps(output, indent=2))
+    if args.stream:
+        with profile(args.profile, args.profile_out), tracing.span("cli.stream"):
+            run_async(print_stream(prompt, config, args.output, cache))
+        timer.mark("run")
     else:
-        print(format_text_output(results, prompt))
+        with profile(args.profile, args.profile_out), tracing.span("cli.run", providers=len(config.get("providers", {}))):
+            results = run_async(run_test(prompt, config, cache))
+        timer.mark("run")
+        
+        if args.output == "json":
+            output = {
+                "prompt": prompt,
+                "results": results,
+            }
+            print(json.dumps(output, indent=2))
+        else:
+            print(format_text_output(results, prompt))
+    
+    if args.timing:
+        print(timer.report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""
+Promptchad - Rate limiting
+
+Token buckets that keep request and token throughput under provider limits.
+"""
+
+import asyncio
+import threading
+import time
+
+# Rough characters-per-token ratio used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute.
+
+    Callers reserve capacity up front and then sleep until their reservation
+    is covered, so waiters are served in arrival order and the bucket can be
+    shared between threads and event loops.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` from the bucket and return the seconds to wait for it."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+    def try_reserve(self, amount: float) -> bool:
+        """Take `amount` only if it is available now, without going into debt."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level < amount:
+                return False
+            self.level -= amount
+            return True
+
+    def refund(self, amount: float):
+        """Give back capacity that was reserved but not used."""
+        with self._lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one provider model."""
+
+    def __init__(self, requests_per_minute: float | None = None, tokens_per_minute: float | None = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait until a request of about `tokens` tokens may be sent.
+
+        Returns the number of seconds spent waiting.
+        """
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens: int) -> bool:
+        """Take capacity for a request only if it can be sent right away."""
+        if self.requests and not self.requests.try_reserve(1):
+            return False
+        if self.tokens and not self.tokens.try_reserve(tokens):
+            if self.requests:
+                self.requests.refund(1)
+            return False
+        return True
+
+    def settle(self, estimated: int, actual: int | None):
+        """Correct the token bucket once the real usage of a request is known."""
+        if self.tokens and actual is not None and actual < estimated:
+            self.tokens.refund(estimated - actual)
+
+
+def estimate_tokens(prompt: str, config: dict) -> int:
+    """Estimate the tokens a request will use: its prompt plus `max_tokens`."""
+    return len(prompt) // CHARS_PER_TOKEN + 1 + config.get("max_tokens", 1024)
+
+
+def used_tokens(result: dict) -> int | None:
+    """Total tokens reported in a provider result, if it has usage."""
+    usage = result.get("usage")
+    if not usage:
+        return None
+    for key in ("total_tokens", "total_token_count"):
+        if key in usage:
+            return usage[key] or None
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0) or None
+
+
+def token_counts(usage: dict | None) -> tuple[int | None, int | None]:
+    """(input, output) tokens from any provider's usage dict."""
+    if not usage:
+        return None, None
+    for input_key, output_key in (
+        ("prompt_tokens", "completion_tokens"),
+        ("input_tokens", "output_tokens"),
+        ("prompt_token_count", "candidates_token_count"),
+    ):
+        if input_key in usage or output_key in usage:
+            return usage.get(input_key), usage.get(output_key)
+    return None, None
@@ -0,0 +1,125 @@
+"""
+Promptchad - Response cache
+
+Content-addressed cache of provider results, stored in SQLite.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+# How many writes go by between eviction passes
+EVICT_EVERY = 100
+
+CACHE_MODES = ["off", "read", "write", "readwrite"]
+
+
+def cache_key(provider: str, prompt: str, config: dict) -> str:
+    """Hash the parts of a request that determine the response."""
+    request = {
+        "provider": provider,
+        "model": config.get("model"),
+        "temperature": config.get("temperature"),
+        "max_tokens": config.get("max_tokens"),
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with age- and size-based LRU eviction.
+
+    Entries older than `max_age_days` are dropped, and once the stored
+    results exceed `max_size_mb` the least recently used ones go first.
+    The `read` and `write` flags control how the cache is used; see
+    `with_mode()` for sharing one store between differently-moded users.
+    """
+
+    def __init__(self, path: Path, max_size_mb: float = 256, max_age_days: float = 30):
+        import sqlite3  # Not needed by runs that don't use the cache
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.read = True
+        self.write = True
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.evict()
+
+    def with_mode(self, mode: str) -> "ResponseCache":
+        """Return a view of this cache that only reads and/or writes as `mode` says."""
+        view = copy.copy(self)
+        view.read = mode in ("read", "readwrite")
+        view.write = mode in ("write", "readwrite")
+        return view
+
+    def get(self, key: str) -> dict | None:
+        """Look up a cached result, marking it as recently used."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.max_age:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, result: dict):
+        """Store a result, evicting old entries every so often."""
+        data = json.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, result, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY:
+                return
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size limit."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_size:
+                return
+            freed = 0
+            doomed = []
+            for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                doomed.append((key,))
+                freed += size
+                if total - freed <= self.max_size:
+                    break
+            self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,123 @@
+"""
+Promptchad - Retries
+
+Error classification and backoff for transient provider failures.
+"""
+
+import random
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+# Statuses worth retrying: timeouts, conflicts, rate limits, server errors and
+# Anthropic's 529 "overloaded"
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+# Exception class names (anywhere in the MRO) that mean the request never got
+# a response. Matched by name so the SDKs don't have to be imported here.
+RETRYABLE_ERRORS = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "TransportError",
+    "TimeoutException",
+    "TimeoutError",
+    "ConnectionError",
+}
+
+# Headers announcing when a rate limit resets, in order of preference
+RESET_HEADERS = [
+    "x-ratelimit-reset-requests",
+    "x-ratelimit-reset-tokens",
+    "anthropic-ratelimit-requests-reset",
+    "anthropic-ratelimit-tokens-reset",
+]
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and how long to retry a provider call."""
+
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    deadline: float = 120.0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RetryPolicy":
+        """Read `max_retries` and `retry_deadline` from a provider config."""
+        return cls(
+            max_retries=config.get("max_retries", cls.max_retries),
+            deadline=config.get("retry_deadline", cls.deadline),
+        )
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry number `attempt` (starting at 1).
+
+        Uses full-jitter exponential backoff, but never retries sooner than
+        the provider asked to.
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return retry_after + backoff * 0.1
+        return backoff
+
+
+def error_result(error: Exception) -> dict:
+    """Build a failed provider result that records whether it may be retried."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    names = {cls.__name__ for cls in type(error).__mro__}
+
+    result = {
+        "success": False,
+        "error": str(error),
+        "retryable": status in RETRYABLE_STATUS if status else bool(names & RETRYABLE_ERRORS),
+    }
+    if status:
+        result["status_code"] = status
+    retry_after = parse_retry_after(getattr(response, "headers", None))
+    if retry_after is not None:
+        result["retry_after"] = retry_after
+    return result
+
+
+def parse_retry_after(headers) -> float | None:
+    """Seconds until the provider will accept another request, if it said so."""
+    if not headers:
+        return None
+
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    if value := headers.get("retry-after"):
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    for header in RESET_HEADERS:
+        if value := headers.get(header):
+            seconds = _parse_reset(value)
+            if seconds is not None:
+                return seconds
+    return None
+
+
+def _parse_reset(value: str) -> float | None:
+    """Parse a reset header: a duration like "6m0s" / "20ms" or an RFC 3339 time."""
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - time.time())
+    except ValueError:
+        return None
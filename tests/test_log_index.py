@@ -0,0 +1,38 @@
+import json
+
+from log_index import LogIndex
+
+
+def run_entry(timestamp: str, response: str) -> dict:
+    result = {"success": True, "response": response, "model": "m", "usage": {"input_tokens": 1, "output_tokens": 2}}
+    return {
+        "timestamp": timestamp,
+        "inputs": {"prompt_a": "Prompt A", "prompt_b": "Prompt B", "shared_input": "Input"},
+        "outputs": {"results_a": {"openai": result}, "results_b": {"openai": result}},
+    }
+
+
+def test_lines_that_are_not_run_entries_are_skipped(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    lines = [
+        json.dumps(run_entry("2025-01-15T10:00:00", "first answer")),
+        "[]",
+        '"just a string"',
+        json.dumps({"inputs": [], "outputs": {}}),
+        json.dumps({"inputs": {}, "outputs": {"results_a": {"openai": "not a result"}}}),
+        json.dumps({"inputs": {}, "outputs": {"results_a": {"openai": {"model": {"not": "text"}}}}}),
+        "{not json",
+        json.dumps(run_entry("2025-01-15T11:00:00", "second answer")),
+    ]
+    (logs / "2025-01-15.jsonl").write_text("\n".join(lines) + "\n")
+
+    index = LogIndex(tmp_path / "index.db", logs)
+    index.update()
+
+    runs, _ = index.query()
+    assert [run["timestamp"] for run in runs] == ["2025-01-15T11:00:00", "2025-01-15T10:00:00"]
+    assert index.search("second")
+    # The bad lines were consumed, so later updates don't trip over them again
+    assert index.update() == 0
+    index.close()
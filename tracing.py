@@ -0,0 +1,268 @@
+"""
+Promptchad - Tracing
+
+Optional OpenTelemetry-compatible tracing. Spans are batched on a
+background thread and exported as OTLP/JSON, either to a collector's OTLP
+HTTP endpoint or appended to a JSON Lines file (one export request per
+line, as read by the collector's `otlpjsonfile` receiver).
+
+Tracing is off unless a `[tracing]` exporter is configured; until then
+`span()` and `start_span()` return a shared no-op span.
+"""
+
+import atexit
+import contextvars
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+
+EXPORTERS = ("none", "otlp", "file")
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"
+DEFAULT_TRACE_PATH = "traces/spans.jsonl"
+
+# Spans exported per request, and the longest a span waits to be exported
+BATCH_SIZE = 512
+FLUSH_SECONDS = 1.0
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+_exporter: "Exporter | None" = None
+_exporter_lock = threading.Lock()
+
+
+class Span:
+    """A timed operation. Use as a context manager, or call `end()`."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end_time", "attributes", "status", "_token")
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time_ns()
+        self.end_time = None
+        self.attributes = attributes
+        self.status = None
+        self._token = None
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_error(self, message: str):
+        self.status = (STATUS_ERROR, message)
+
+    def activate(self):
+        """Make this the parent of spans started in the current context."""
+        self._token = _current.set(self)
+        return self
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # Ended from another context (e.g. after a streamed response)
+                pass
+            self._token = None
+        exporter = _exporter
+        if exporter:
+            exporter.submit(self)
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off."""
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def activate(self):
+        return self
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+def start_span(name: str, **attributes) -> Span | _NoopSpan:
+    """Start a span under the current one. It must be ended with `end()`."""
+    if _exporter is None:
+        return NOOP_SPAN
+    return Span(name, _current.get(), attributes)
+
+
+def span(name: str, **attributes) -> Span | _NoopSpan:
+    """Context manager timing a block, and the parent of spans started inside it."""
+    return start_span(name, **attributes)
+
+
+def in_current_span(coro):
+    """Wrap a coroutine so spans it starts on another thread's event loop
+    are children of the span current here."""
+    parent = _current.get()
+    if parent is None:
+        return coro
+
+    async def run():
+        _current.set(parent)
+        return await coro
+
+    return run()
+
+
+def _attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": [
+            {"key": key, "value": _attribute_value(value)}
+            for key, value in span.attributes.items()
+            if value is not None
+        ],
+        "status": {"code": STATUS_OK},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    if span.status:
+        data["status"] = {"code": span.status[0], "message": span.status[1]}
+    return data
+
+
+class Exporter:
+    """Background thread batching finished spans into OTLP/JSON exports."""
+
+    def __init__(self, kind: str, service_name: str, endpoint: str, path: Path):
+        self.kind = kind
+        self.service_name = service_name
+        self.endpoint = endpoint
+        self.path = path
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="promptchad-tracing", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span):
+        self._queue.put(span)
+
+    def shutdown(self):
+        """Export remaining spans and stop."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            spans = [span for span in batch if span is not None]
+            if spans:
+                try:
+                    self._export(spans)
+                except Exception as e:
+                    print(f"Error exporting {len(spans)} spans: {e}", file=sys.stderr)
+            if batch[-1] is None:
+                return
+
+    def _export(self, spans: list[Span]):
+        payload = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "promptchad"},
+                    "spans": [_otlp_span(span) for span in spans],
+                }],
+            }],
+        })
+        if self.kind == "file":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(payload + "\n")
+        else:
+            import urllib.request  # Only needed once spans are exported
+
+            request = urllib.request.Request(
+                self.endpoint,
+                data=payload.encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+
+
+def configure(settings: Mapping):
+    """Start exporting spans as set in the `[tracing]` config section.
+
+    `exporter` is "otlp" (to `endpoint`), "file" (to `path`) or "none".
+    Only the first configuration with an exporter takes effect.
+    """
+    global _exporter
+    kind = settings.get("exporter", "none")
+    if kind not in EXPORTERS:
+        raise ValueError(f"Unknown tracing exporter {kind!r} (expected one of {', '.join(EXPORTERS)})")
+    if kind == "none" or _exporter is not None:
+        return
+
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = Exporter(
+                kind,
+                service_name=settings.get("service_name", "promptchad"),
+                endpoint=settings.get("endpoint", DEFAULT_OTLP_ENDPOINT),
+                path=Path(settings.get("path", DEFAULT_TRACE_PATH)),
+            )
+            atexit.register(_exporter.shutdown)
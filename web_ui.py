@@ -5,28 +5,81 @@ Promptchad - Web UI
 Simple Flask server that wraps the CLI tool.
 """
 
-import asyncio
+import atexit
+import hmac
 import json
+import os
+import sys
+import threading
 from datetime import datetime, timezone
 from pathlib import Path
 
-import toml
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, g, jsonify, render_template, request, stream_with_context
 
-from promptchad import run_test
+import metrics
+import tracing
+from atomic_files import atomic_write_text
+from config_manager import ConfigError, get_config_manager, redact_secret, redact_secrets
+from jobs import JobQueue, JobStore
+from log_index import SEARCH_FIELDS, LogIndex
+from log_writer import LogWriter
+from profiling import SAMPLERS
+from promptchad import (
+    EventLoopThread,
+    combine_prompt,
+    iter_variants,
+    merge_streams,
+    open_cache,
+    run_variants,
+    stream_test,
+)
 
 app = Flask(__name__)
 
+# All provider calls run on one shared event loop so that concurrent requests
+# reuse warm clients and connection pools
+event_loop = EventLoopThread()
+atexit.register(event_loop.close)
+
+# Background job queue, created on first use
+job_queue: JobQueue | None = None
+job_queue_lock = threading.Lock()
+
+# Background log writer, created on first use
+log_writer: LogWriter | None = None
+log_writer_lock = threading.Lock()
+
+# Index over the run logs, created on first use
+log_index: LogIndex | None = None
+log_index_lock = threading.Lock()
+
+# One /debug/profile sample at a time
+profile_lock = threading.Lock()
+MAX_PROFILE_SECONDS = 60
+
+# Tracing is set up from the `[tracing]` section on the first request
+tracing_configured = False
+
+# Web server metrics; provider call metrics are recorded by promptchad
+requests_in_flight = metrics.REGISTRY.register(metrics.Gauge(
+    "promptchad_http_requests_in_flight",
+    "HTTP requests being handled",
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "promptchad_job_queue_depth",
+    "Background jobs queued or running",
+    function=lambda: job_queue.pending() if job_queue else 0,
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    "promptchad_log_writer_backlog",
+    "Log entries waiting to be written",
+    function=lambda: log_writer.pending() if log_writer else 0,
+))
+
 CONFIG_PATH = Path("config.toml")
 PROMPTS_DIR = Path("prompts")
 LOGS_DIR = Path("logs")
-
-
-def redact_api_key(key: str) -> str:
-    """Redact API key, showing only last 4 characters."""
-    if not key or len(key) <= 4:
-        return "****"
-    return f"****{key[-4:]}"
+DEFAULT_JOBS_PATH = "jobs/jobs.db"
 
 
 def get_config_for_logging(config: dict) -> dict:
@@ -35,33 +88,162 @@ def get_config_for_logging(config: dict) -> dict:
     for provider, settings in config.get("providers", {}).items():
         log_config["providers"][provider] = {
             **settings,
-            "api_key": redact_api_key(settings.get("api_key", ""))
+            "api_key": redact_secret(settings.get("api_key", ""))
         }
     return log_config
 
 
-def log_test_run(prompt_a: str, prompt_b: str, shared_input: str, results_a: dict, results_b: dict, config: dict):
-    """Log test run to a structured JSON Lines file."""
-    LOGS_DIR.mkdir(exist_ok=True)
+def get_log_writer(config: dict) -> LogWriter:
+    """Return the background log writer, starting it on first use.
+    
+    Settings come from the `[logs]` config section: `max_size_mb` per log
+    segment, `compress` ("gzip", "zstd" or "none") for finished segments and
+    `format` ("full" or "dedup").
+    """
+    global log_writer
+    with log_writer_lock:
+        if log_writer is None:
+            logs_config = config.get("logs", {})
+            log_writer = LogWriter(
+                LOGS_DIR,
+                max_size_mb=logs_config.get("max_size_mb", 100),
+                compress=logs_config.get("compress", "gzip"),
+                format=logs_config.get("format", "full"),
+            )
+            atexit.register(log_writer.close)
+        return log_writer
+
+
+def write_log_entry(inputs: dict, outputs: dict, config: dict):
+    """Queue a run to be appended to the daily JSON Lines log.
     
+    A run that can't be logged is reported on stderr; the results it has
+    already paid for are still returned.
+    """
     log_entry = {
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "inputs": {
-            "prompt_a": prompt_a,
-            "prompt_b": prompt_b,
-            "shared_input": shared_input,
-        },
+        "inputs": inputs,
         "config": get_config_for_logging(config),
-        "outputs": {
-            "results_a": results_a,
-            "results_b": results_b,
-        }
+        "outputs": outputs,
     }
+    try:
+        get_log_writer(config).write(log_entry)
+    except Exception as e:
+        print(f"Warning: could not log run: {e}", file=sys.stderr)
+
+
+def log_test_run(prompt_a: str, prompt_b: str, shared_input: str, results_a: dict, results_b: dict, config: dict):
+    """Log test run to a structured JSON Lines file."""
+    with tracing.span("log_test_run"):
+        write_log_entry(
+            inputs={
+                "prompt_a": prompt_a,
+                "prompt_b": prompt_b,
+                "shared_input": shared_input,
+            },
+            outputs={
+                "results_a": results_a,
+                "results_b": results_b,
+            },
+            config=config,
+        )
+
+
+def log_variants_run(prompts: dict, shared_input: str, results: dict, config: dict):
+    """Log an N-variant test run to a structured JSON Lines file."""
+    with tracing.span("log_variants_run"):
+        write_log_entry(
+            inputs={
+                "prompts": prompts,
+                "shared_input": shared_input,
+            },
+            outputs={
+                "results": results,
+            },
+            config=config,
+        )
+
+
+def configure_tracing():
+    """Start exporting spans if the config has a `[tracing]` exporter."""
+    global tracing_configured
+    try:
+        config = current_config().data
+    except ConfigError:
+        return
+    tracing.configure(config.get("tracing", {}))
+    tracing_configured = True
+
+
+@app.before_request
+def count_request_start():
+    requests_in_flight.inc()
+    if not tracing_configured:
+        configure_tracing()
+    g.span = tracing.start_span(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        **{"http.request.method": request.method, "url.path": request.path},
+    ).activate()
+
+
+@app.teardown_request
+def count_request_end(error=None):
+    requests_in_flight.dec()
+    span = g.pop("span", None)
+    if span:
+        if error is not None:
+            span.set_error(f"{type(error).__name__}: {error}")
+        span.end()
+
+
+@app.after_request
+def record_response_status(response):
+    g.get("span", tracing.NOOP_SPAN).set_attributes(**{"http.response.status_code": response.status_code})
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics."""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/debug/profile")
+def debug_profile():
+    """Profile the live server for `seconds` (default 10, at most 60).
+    
+    `mode` is "cpu" (sampled stacks of all threads, in collapsed flamegraph
+    format), "async" (slow event loop callbacks) or "memory" (allocation
+    growth). Only enabled with `profiling = true` and a `profile_token` in
+    the `[debug]` config section; requests must come from this machine and
+    send the token as `Authorization: Bearer <token>`. Behind a reverse
+    proxy every request appears to come from localhost, so the token is
+    what actually guards the endpoint.
+    """
+    debug = current_config().data.get("debug", {})
+    token = debug.get("profile_token", "")
+    if not debug.get("profiling", False) or not token:
+        return jsonify({"error": "Profiling is disabled; set profiling = true and profile_token under [debug]"}), 404
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Profiling is only available from localhost"}), 403
+    sent = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(sent.encode(), str(token).encode()):
+        return jsonify({"error": "Missing or wrong profile token"}), 403
     
-    # Append to daily log file
-    log_file = LOGS_DIR / f"{datetime.now().strftime('%Y-%m-%d')}.jsonl"
-    with open(log_file, "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+    mode = request.args.get("mode", "cpu")
+    if mode not in SAMPLERS:
+        return jsonify({"error": f"mode must be one of {', '.join(SAMPLERS)}"}), 400
+    seconds = request.args.get("seconds", 10, type=float)
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {MAX_PROFILE_SECONDS}"}), 400
+    
+    if not profile_lock.acquire(blocking=False):
+        return jsonify({"error": "A profile is already being taken"}), 409
+    try:
+        report = SAMPLERS[mode](seconds)
+    finally:
+        profile_lock.release()
+    return Response(report, mimetype="text/plain")
 
 
 @app.route("/")
@@ -70,21 +252,30 @@ def index():
     return render_template("index.html")
 
 
+def current_config():
+    """The current config snapshot, parsed once per change of config.toml."""
+    return get_config_manager(CONFIG_PATH).snapshot()
+
+
 @app.route("/api/config", methods=["GET"])
 def get_config():
-    """Get current configuration."""
-    if CONFIG_PATH.exists():
-        config = toml.load(CONFIG_PATH)
-        return jsonify(config)
+    """Get current configuration, with API keys and tokens redacted."""
+    try:
+        snapshot = current_config()
+    except ConfigError as e:
+        return jsonify({"error": str(e)}), 500
+    if snapshot.exists:
+        return jsonify(redact_secrets(snapshot.data))
     return jsonify({"providers": {}})
 
 
 @app.route("/api/config", methods=["POST"])
 def save_config():
-    """Save configuration."""
-    config = request.json
-    with open(CONFIG_PATH, "w") as f:
-        toml.dump(config, f)
+    """Validate and save configuration."""
+    try:
+        get_config_manager(CONFIG_PATH).save(request.json)
+    except ConfigError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"success": True})
 
 
@@ -107,56 +298,335 @@ def get_prompt(name):
 
 @app.route("/api/prompts/<name>", methods=["POST"])
 def save_prompt(name):
-    """Save a prompt."""
-    PROMPTS_DIR.mkdir(exist_ok=True)
+    """Save a prompt, replacing any previous version atomically."""
     content = request.json.get("content", "")
-    prompt_path = PROMPTS_DIR / f"{name}.txt"
-    prompt_path.write_text(content)
+    atomic_write_text(PROMPTS_DIR / f"{name}.txt", content)
     return jsonify({"success": True})
 
 
-@app.route("/api/run", methods=["POST"])
-def run():
-    """Run the A/B prompt test."""
-    data = request.json
-    prompt_a = data.get("prompt_a", "").strip()
-    prompt_b = data.get("prompt_b", "").strip()
-    shared_input = data.get("shared_input", "").strip()
+def parse_run_request():
+    """Read and validate an A/B run request.
+    
+    Returns (prompt_a, prompt_b, shared_input, config, error_response);
+    error_response is None when the request is valid.
+    """
+    with tracing.span("parse_request"):
+        data = request.json
+        prompt_a = data.get("prompt_a", "").strip()
+        prompt_b = data.get("prompt_b", "").strip()
+        shared_input = data.get("shared_input", "").strip()
     
     if not prompt_a and not prompt_b:
-        return jsonify({"error": "At least one prompt is required"}), 400
+        return None, None, None, None, (jsonify({"error": "At least one prompt is required"}), 400)
+    
+    config, error = load_run_config()
+    return prompt_a, prompt_b, shared_input, config, error
+
+
+def load_run_config():
+    """Load the config for a run. Returns (config, error_response)."""
+    try:
+        with tracing.span("config_load"):
+            snapshot = current_config()
+    except ConfigError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    if not snapshot.exists:
+        return None, (jsonify({"error": "Config file not found"}), 400)
+    
+    return snapshot.data, None
+
+
+def request_cache(config: dict):
+    """Return the response cache if the request asked for it (`"cache": true`)."""
+    return open_cache(config, "readwrite" if request.json.get("cache") else "off")
+
+
+async def execute_job(job_request: dict, report) -> dict:
+    """Run a queued A/B or N-variant job, reporting results as they arrive."""
+    snapshot = current_config()
+    if not snapshot.exists:
+        raise RuntimeError("Config file not found")
+    config = snapshot.data
     
-    if not CONFIG_PATH.exists():
-        return jsonify({"error": "Config file not found"}), 400
+    prompts = job_request["prompts"]
+    shared_input = job_request["shared_input"]
+    with tracing.span("job", kind=job_request["kind"], variants=len(prompts)):
+        with tracing.span("combine_prompts"):
+            full_prompts = {name: combine_prompt(prompt, shared_input) for name, prompt in prompts.items()}
+        cache = open_cache(config, "readwrite" if job_request.get("cache") else "off")
+        
+        results = {name: {} for name in prompts}
+        async for variant, provider, result in iter_variants(full_prompts, config, cache):
+            results[variant][provider] = result
+            report(results)
+        
+        if job_request["kind"] == "ab":
+            log_test_run(prompts["a"], prompts["b"], shared_input, results["a"], results["b"], config)
+        else:
+            log_variants_run(prompts, shared_input, results, config)
+        return results
+
+
+def get_job_queue() -> JobQueue:
+    """Return the job queue, resuming unfinished jobs when it is first created.
+    
+    Settings come from the `[jobs]` config section: `path` of the job
+    database and `concurrency`, the number of jobs run at once.
+    """
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            config = current_config().data
+            jobs_config = config.get("jobs", {})
+            job_queue = JobQueue(
+                JobStore(Path(jobs_config.get("path", DEFAULT_JOBS_PATH))),
+                event_loop.loop,
+                execute_job,
+                concurrency=jobs_config.get("concurrency", 4),
+            )
+            job_queue.resume()
+        return job_queue
+
+
+def enqueue_job(kind: str, prompts: dict, shared_input: str):
+    """Queue a run in the background and respond with its job id."""
+    job_id = get_job_queue().submit({
+        "kind": kind,
+        "prompts": prompts,
+        "shared_input": shared_input,
+        "cache": bool(request.json.get("cache")),
+    })
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+@app.route("/api/run", methods=["POST"])
+def run():
+    """Run the A/B prompt test.
     
-    config = toml.load(CONFIG_PATH)
+    With `"async": true` the run is queued as a background job instead and
+    its id returned at once; poll `/api/jobs/<id>` for results.
+    """
+    prompt_a, prompt_b, shared_input, config, error = parse_run_request()
+    if error:
+        return error
     
-    # Combine prompts with shared input
-    def combine_prompt(prompt, shared):
-        if not prompt:
-            return ""
-        if not shared:
-            return prompt
-        return f"{prompt}\n\n---\n\n{shared}"
+    if request.json.get("async"):
+        return enqueue_job("ab", {"a": prompt_a, "b": prompt_b}, shared_input)
     
-    full_prompt_a = combine_prompt(prompt_a, shared_input)
-    full_prompt_b = combine_prompt(prompt_b, shared_input)
+    with tracing.span("combine_prompts"):
+        full_prompt_a = combine_prompt(prompt_a, shared_input)
+        full_prompt_b = combine_prompt(prompt_b, shared_input)
     
-    # Run tests for both prompts
-    results_a = asyncio.run(run_test(full_prompt_a, config)) if full_prompt_a else {}
-    results_b = asyncio.run(run_test(full_prompt_b, config)) if full_prompt_b else {}
+    # Run both prompts against all providers concurrently
+    cache = request_cache(config)
+    with tracing.span("run_variants", variants=2):
+        results = event_loop.run(run_variants({"a": full_prompt_a, "b": full_prompt_b}, config, cache))
+    results_a = results["a"]
+    results_b = results["b"]
     
     # Log the test run (log original prompts and shared input separately)
     log_test_run(prompt_a, prompt_b, shared_input, results_a, results_b, config)
     
-    return jsonify({
-        "prompt_a": prompt_a,
-        "prompt_b": prompt_b,
-        "shared_input": shared_input,
-        "results_a": results_a,
-        "results_b": results_b,
-    })
+    with tracing.span("serialize_results"):
+        return jsonify({
+            "prompt_a": prompt_a,
+            "prompt_b": prompt_b,
+            "shared_input": shared_input,
+            "results_a": results_a,
+            "results_b": results_b,
+        })
+
+
+@app.route("/api/run/variants", methods=["POST"])
+def run_variants_endpoint():
+    """Run any number of prompt variants (A, B, C, ...) at once.
+    
+    Expects `prompts` as an object mapping variant names to prompt text and
+    an optional `shared_input`; results are keyed the same way. Accepts
+    `"async": true` like `/api/run`.
+    """
+    with tracing.span("parse_request"):
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        prompts = data.get("prompts") or {}
+        shared_input = data.get("shared_input") or ""
+        if not isinstance(prompts, dict) or not all(isinstance(p, str | None) for p in prompts.values()):
+            return jsonify({"error": "prompts must map variant names to prompt text"}), 400
+        if not isinstance(shared_input, str):
+            return jsonify({"error": "shared_input must be text"}), 400
+        prompts = {name: (prompt or "").strip() for name, prompt in prompts.items()}
+        shared_input = shared_input.strip()
+    
+    if not any(prompts.values()):
+        return jsonify({"error": "At least one prompt is required"}), 400
+    
+    config, error = load_run_config()
+    if error:
+        return error
+    
+    if data.get("async"):
+        return enqueue_job("variants", prompts, shared_input)
+    
+    with tracing.span("combine_prompts"):
+        full_prompts = {name: combine_prompt(prompt, shared_input) for name, prompt in prompts.items()}
+    with tracing.span("run_variants", variants=len(full_prompts)):
+        results = event_loop.run(run_variants(full_prompts, config, request_cache(config)))
+    
+    log_variants_run(prompts, shared_input, results, config)
+    
+    with tracing.span("serialize_results"):
+        return jsonify({
+            "prompts": prompts,
+            "shared_input": shared_input,
+            "results": results,
+        })
+
+
+def sse_event(data: dict) -> str:
+    """Encode a Server-Sent Events message."""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/run/stream", methods=["POST"])
+def run_stream():
+    """Run the A/B prompt test, streaming output as Server-Sent Events.
+    
+    Each event is a JSON object with `variant` ("a" or "b"), `provider` and
+    the provider stream event (`type` "delta" with `text`, or "result" with
+    the final `result`). A final `{"type": "done"}` event follows once the
+    run has been logged.
+    """
+    prompt_a, prompt_b, shared_input, config, error = parse_run_request()
+    if error:
+        return error
+    
+    cache = request_cache(config)
+    streams = {}
+    with tracing.span("combine_prompts"):
+        full_prompts = {"a": combine_prompt(prompt_a, shared_input), "b": combine_prompt(prompt_b, shared_input)}
+    for variant, full_prompt in full_prompts.items():
+        if full_prompt:
+            streams[variant] = stream_test(full_prompt, config, cache)
+    
+    # The response is generated after the request span ends, so it gets its own
+    stream_span = tracing.start_span("stream_results")
+    
+    def generate():
+        with stream_span:
+            results = {"a": {}, "b": {}}
+            for variant, (provider, event) in event_loop.iterate(merge_streams(streams)):
+                if event["type"] == "result":
+                    results[variant][provider] = event["result"]
+                yield sse_event({"variant": variant, "provider": provider, **event})
+            
+            log_test_run(prompt_a, prompt_b, shared_input, results["a"], results["b"], config)
+            yield sse_event({"type": "done"})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    """List recent jobs, newest first, without their results."""
+    jobs = get_job_queue().store.recent(limit=request.args.get("limit", 50, type=int))
+    return jsonify([{k: v for k, v in job.items() if k != "results"} for job in jobs])
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Get a job's status and its results so far."""
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """Cancel a queued or running job, aborting its in-flight provider calls."""
+    queue = get_job_queue()
+    if queue.store.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"success": queue.cancel(job_id)})
+
+
+def get_log_index() -> LogIndex:
+    """Return the log index, brought up to date with everything logged so far.
+    
+    The index lives at `[logs] index_path` (default `logs/index.db`).
+    """
+    global log_index
+    with log_index_lock:
+        if log_index is None:
+            config = current_config().data
+            index_path = config.get("logs", {}).get("index_path")
+            log_index = LogIndex(Path(index_path) if index_path else LOGS_DIR / "index.db", LOGS_DIR)
+    if log_writer:
+        log_writer.flush()
+    log_index.update()
+    return log_index
+
+
+@app.route("/api/logs", methods=["GET"])
+def list_logs():
+    """Query logged runs, newest first.
+    
+    Filters: `since` / `until` (ISO date or timestamp, `until` exclusive),
+    `provider`, `model` and `prompt_hash` (sha256 of a prompt, or a prefix
+    of one). Pages hold `limit` runs; pass `next_cursor` back as `cursor`
+    for the next page.
+    """
+    runs, next_cursor = get_log_index().query(
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+        provider=request.args.get("provider"),
+        model=request.args.get("model"),
+        prompt_hash=request.args.get("prompt_hash"),
+        cursor=request.args.get("cursor", type=int),
+        limit=min(request.args.get("limit", 50, type=int), 500),
+    )
+    return jsonify({"runs": runs, "next_cursor": next_cursor})
+
+
+@app.route("/api/search", methods=["GET"])
+def search_logs():
+    """Full-text search over logged prompts, shared inputs and responses.
+    
+    `q` holds the words to find (all must match; end a word with `*` for a
+    prefix match). `field` narrows matches to "prompt", "shared_input" or
+    "response". Results are ranked, with `limit` and `offset` for paging.
+    """
+    query = request.args.get("q", "").strip()
+    field = request.args.get("field") or None
+    if field and field not in SEARCH_FIELDS:
+        return jsonify({"error": f"field must be one of {', '.join(SEARCH_FIELDS)}"}), 400
+    
+    hits = get_log_index().search(
+        query,
+        field=field,
+        limit=min(request.args.get("limit", 20, type=int), 100),
+        offset=request.args.get("offset", 0, type=int),
+    )
+    return jsonify({"query": query, "hits": hits})
+
+
+@app.route("/api/logs/<int:run_id>", methods=["GET"])
+def get_log(run_id):
+    """Get a logged run's full entry."""
+    entry = get_log_index().entry(run_id)
+    if entry is None:
+        return jsonify({"error": "Run not found"}), 404
+    return jsonify(entry)
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    # Pick up jobs interrupted by a restart; with the debug reloader only the
+    # child process serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_job_queue()
+    app.run(debug=True, port=5000, threaded=True)